@@ -0,0 +1,145 @@
+import frappe
+from frappe.utils import flt, now_datetime
+
+from personal_trainer_app.api import MembershipCache
+
+STRESS_BUSTER_LOGS = 7
+WORKOUT_TIME_ACHIEVEMENT_COUNT = 15
+EARLY_WORKOUT_HOURS = range(5, 10)
+LATE_WORKOUT_HOURS = range(18, 24)
+COUNTER_FIELDS = ["logged_exercises_count", "early_workouts_count", "late_workouts_count"]
+ACHIEVEMENT_FIELDS = [
+    "personal_record_setter", "stress_buster", "bmi_boss", "first_kilo_lost", "halfway_there",
+    "total_transformation", "level_up", "first_step", "rise_and_grind", "night_owl"
+]
+
+def get_best_performance(client, exercise):
+    """Best weight and reps logged so far by a client for an exercise"""
+    best = frappe.db.sql("""
+        SELECT MAX(weight), MAX(reps)
+        FROM `tabPerformance Log`
+        WHERE parenttype = 'Client' AND parentfield = 'exercise_performance'
+            AND parent = %s AND exercise = %s
+    """, (client, exercise))
+    return best[0] if best and best[0][0] is not None else None
+
+def record_performance(client_doc, exercise, weight, reps, logged_at=None):
+    """Update counters and flags for a performance row about to be appended to the client"""
+    best = None if client_doc.is_new() else get_best_performance(client_doc.name, exercise)
+    if best and (weight > flt(best[0]) or reps > flt(best[1])):
+        client_doc.level_up = 1
+    client_doc.personal_record_setter = 1
+
+    hour = (logged_at or now_datetime()).hour
+    if hour in EARLY_WORKOUT_HOURS:
+        client_doc.early_workouts_count = (client_doc.early_workouts_count or 0) + 1
+    elif hour in LATE_WORKOUT_HOURS:
+        client_doc.late_workouts_count = (client_doc.late_workouts_count or 0) + 1
+    apply_achievements(client_doc, evaluate_counter_achievements(client_doc))
+
+def record_logged_exercise(client_doc):
+    """Count a plan exercise (not part of a superset) that was just marked as logged"""
+    client_doc.logged_exercises_count = (client_doc.logged_exercises_count or 0) + 1
+    apply_achievements(client_doc, evaluate_counter_achievements(client_doc))
+
+def record_weight(client_doc):
+    """Evaluate the weight based achievements after a weight row was appended"""
+    weights = client_doc.weight or []
+    apply_achievements(client_doc, evaluate_weight_achievements(
+        client_doc,
+        weights[0].weight if weights else None,
+        weights[-1].weight if weights else None
+    ))
+
+def apply_achievements(client_doc, flags):
+    for field in flags:
+        client_doc.set(field, 1)
+
+def evaluate_counter_achievements(client):
+    """Counter based achievements a client row or document has earned but not been awarded yet"""
+    earned = {
+        "first_step": (client.logged_exercises_count or 0) >= 1,
+        "stress_buster": (client.logged_exercises_count or 0) >= STRESS_BUSTER_LOGS,
+        "rise_and_grind": (client.early_workouts_count or 0) >= WORKOUT_TIME_ACHIEVEMENT_COUNT,
+        "night_owl": (client.late_workouts_count or 0) >= WORKOUT_TIME_ACHIEVEMENT_COUNT
+    }
+    return [field for field, value in earned.items() if value and not client.get(field)]
+
+def evaluate_weight_achievements(client, starting_weight, latest_weight):
+    """Weight based achievements a client has earned but not been awarded yet"""
+    starting_weight = flt(starting_weight) or None
+    latest_weight = flt(latest_weight) or None
+    target_weight = flt(client.target_weight) or None
+    height_m = flt(client.height) / 100 if client.height else None  # Convert to meters
+
+    earned = {}
+    if height_m and latest_weight:
+        earned["bmi_boss"] = 18.5 <= latest_weight / (height_m ** 2) <= 24.9  # Healthy BMI range
+    if starting_weight and latest_weight:
+        earned["first_kilo_lost"] = (starting_weight - latest_weight) >= 1
+        if target_weight:
+            earned["halfway_there"] = (starting_weight - latest_weight) >= (starting_weight - target_weight) / 2
+            earned["total_transformation"] = latest_weight <= target_weight
+    return [field for field, value in earned.items() if value and not client.get(field)]
+
+def get_weight_bounds(clients):
+    """First and latest logged weight of several clients in one query"""
+    if not clients:
+        return {}
+    rows = frappe.db.sql("""
+        SELECT parent,
+            MAX(CASE WHEN first_row = 1 THEN weight END) AS starting_weight,
+            MAX(CASE WHEN last_row = 1 THEN weight END) AS latest_weight
+        FROM (
+            SELECT parent, weight,
+                ROW_NUMBER() OVER (PARTITION BY parent ORDER BY idx ASC) AS first_row,
+                ROW_NUMBER() OVER (PARTITION BY parent ORDER BY idx DESC) AS last_row
+            FROM `tabWeight Log`
+            WHERE parenttype = 'Client' AND parentfield = 'weight' AND parent IN %(clients)s
+        ) ranked
+        GROUP BY parent
+    """, {"clients": tuple(clients)}, as_dict=True)
+    return {row.parent: row for row in rows}
+
+def update_clients_achievements(clients=None):
+    """
+    Award achievements that follow from the running counters and weights, reading only
+    clients with something left to earn and writing only clients whose flags flip.
+    Returns the number of updated clients.
+    """
+    filters = [["Client", field, "=", 0] for field in ACHIEVEMENT_FIELDS]
+    client_rows = frappe.get_all(
+        "Client",
+        filters={"name": ["in", clients]} if clients is not None else None,
+        or_filters=filters,
+        fields=["name", "height", "target_weight", *COUNTER_FIELDS, *ACHIEVEMENT_FIELDS]
+    )
+    if not client_rows:
+        return 0
+
+    weights = get_weight_bounds([client.name for client in client_rows])
+    with_performance = set(frappe.get_all(
+        "Performance Log",
+        filters={"parenttype": "Client", "parent": ["in", [
+            client.name for client in client_rows if not client.personal_record_setter
+        ] or [""]]},
+        pluck="parent",
+        distinct=True
+    ))
+
+    updates = {}
+    for client in client_rows:
+        flags = evaluate_counter_achievements(client)
+        bounds = weights.get(client.name)
+        if bounds:
+            flags += evaluate_weight_achievements(client, bounds.starting_weight, bounds.latest_weight)
+        if not client.personal_record_setter and client.name in with_performance:
+            flags.append("personal_record_setter")
+        if flags:
+            updates[client.name] = dict.fromkeys(flags, 1)
+
+    if updates:
+        # Leave modified alone so awards do not pull clients into the statistics reconcile set
+        frappe.db.bulk_update("Client", updates, update_modified=False)
+        MembershipCache().invalidate_clients_caches(list(updates))
+    return len(updates)
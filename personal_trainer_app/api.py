@@ -1,8 +1,21 @@
 from __future__ import unicode_literals
 from typing import Dict, List, Optional, Any, TypedDict, Tuple, Set
+from functools import partial
 import hashlib
+import json
+import pickle
+import time
 import frappe
-from personal_trainer_app.config.nutrition import get_nutrient_mappings
+from personal_trainer_app.config.nutrition import MACRO_COLUMNS, get_nutrient_resolver
+from personal_trainer_app.loaders import attach_plan_children, load_plans
+from personal_trainer_app.nutrition_engine import NutritionEngine, base_nutrition_from_references, daily_items
+from personal_trainer_app.local_cache import (
+    ensure_invalidation_listener, library_cache, publish_library_invalidation
+)
+from personal_trainer_app.responses import (
+    RESPONSE_ENVELOPES, compress_json, decompress_body, encoded_json_response, get_response_envelope,
+    is_http_request, json_response, make_etag, not_modified_response, request_matches_etag
+)
 
 # Type definitions
 class NutritionFact(TypedDict):
@@ -19,18 +32,19 @@ class DailyTotals(TypedDict):
 NUTRIENTS = ('energy', 'protein', 'carbs', 'fat')
 DEFAULT_UNITS = {'energy': 'kcal', 'protein': 'g', 'carbs': 'g', 'fat': 'g'}
 KCAL_TO_KJ = 4.184
+MEMBERSHIP_PAYLOAD_VERSION = "1.8"
+# Only INCR an existing counter, a missing one is rebuilt on next read
+BUMP_VERSION_SCRIPT = "if redis.call('exists', KEYS[1]) == 1 then return redis.call('incr', KEYS[1]) end return nil"
+DEFAULT_PERFORMANCE_HISTORY_LIMIT = 10
 
 class MembershipCache:
     def __init__(self):
         self.LIBRARY_CACHE_TIMEOUT = 86400 * 7  # 7 days for foods and exercises
         self.MEMBERSHIP_CACHE_TIMEOUT = 3600 * 24  # 24 hours for membership data
+        self.REBUILD_LOCK_TIMEOUT = 30  # seconds before a crashed rebuild releases its lock
+        self.REBUILD_WAIT_TIMEOUT = 5  # seconds to wait for another worker's rebuild when nothing is cached
+        self.WARM_AHEAD = 3600 * 2  # rebuild payloads expiring before the next hourly warm pass has run
         
-    def get_cache_key(self, prefix: str, *args) -> str:
-        """Generate a consistent cache key"""
-        key_parts = [str(arg) for arg in args]
-        key_string = f"{prefix}:{':'.join(key_parts)}"
-        return hashlib.md5(key_string.encode()).hexdigest()
-
     def get_membership_cache_key(self, membership_id: str) -> str:
         """Get cache key for membership data"""
         return f"membership_data:{membership_id}"
@@ -43,70 +57,225 @@ class MembershipCache:
         """Get cache key for library items (foods/exercises)"""
         return f"library:{item_type}:{item_id}"
 
-    def get_version_hash_key(self, membership_id: str) -> str:
-        """Get cache key for version hash"""
-        return f"version_hash:{membership_id}"
+    def get_library_snapshot_key(self) -> str:
+        """Get cache key for the shared library snapshot"""
+        return "library_snapshot"
+
+    def get_version_counter_key(self, membership_id: str) -> str:
+        """Get cache key for the membership version counter"""
+        return f"membership_version:{membership_id}"
+
+    def get_response_cache_key(self, membership_id: str, envelope: str) -> str:
+        """Get cache key for the serialized membership response"""
+        return f"membership_response:{membership_id}:{envelope}"
+
+    def get_plan_fragment_key(self, plan_name: str, modified: Any) -> str:
+        """Get cache key for a processed plan fragment"""
+        return f"plan_fragment:{plan_name}:{modified}"
 
-    # In the same class MembershipCache
-    def get_membership_version(self, membership_id: str) -> str:
-        """Get version hash based on membership, client, and plans data"""
+    def get_manifest_key(self, membership_id: str, version: str) -> str:
+        """Get cache key for the payload manifest of a membership version"""
+        return f"membership_manifest:{membership_id}:{version}"
+
+    def get_membership_version(self, membership_id: str) -> Optional[str]:
+        """Get version of membership data from its counter, a single GET on the hot path"""
         try:
-            # Try to get cached version first
-            cached_version = frappe.cache().get_value(self.get_version_hash_key(membership_id))
-            if cached_version:
-                return cached_version
-
-            CODE_VERSION = "1.7"
-            membership_doc = frappe.get_doc("Membership", membership_id)
-            client_doc = frappe.get_doc("Client", membership_doc.client)
-            
-            plans = frappe.get_all(
-                "Plan",
-                filters={"membership": membership_id},
-                fields=["name", "modified", "modified_by"]
-            )
-            
-            version_parts = [
-                f"v:{CODE_VERSION}",
-                f"m:{membership_doc.modified}:{membership_doc.modified_by}",
-                f"c:{client_doc.modified}:{client_doc.modified_by}",
-                f"p:{len(plans)}",
-                f"l:{max(p.modified for p in plans) if plans else 'none'}"
-            ]
-            
-            version = hashlib.md5(":".join(version_parts).encode()).hexdigest()
-            
-            # Cache the version
-            frappe.cache().set_value(
-                self.get_version_hash_key(membership_id),
-                version,
-                expires_in_sec=self.MEMBERSHIP_CACHE_TIMEOUT
-            )
-            
-            return version
+            redis = frappe.cache()
+            counter = redis.get(redis.make_key(self.get_version_counter_key(membership_id)))
+            if counter is None:
+                counter = self.rebuild_membership_version(membership_id)
+            if counter is None:
+                return None
+            return f"{MEMBERSHIP_PAYLOAD_VERSION}.{int(counter)}"
         except Exception as e:
-            frappe.log_error(f"Error generating membership version: {str(e)}")
+            frappe.log_error(f"Error getting membership version: {str(e)}")
             return None
-    def get_cached_membership_data(self, membership_id: str) -> Optional[Dict[str, Any]]:
-        """Get cached membership data if valid"""
-        cache_key = self.get_membership_cache_key(membership_id)
-        version_key = self.get_plans_version_key(membership_id)
-        
-        cached_data = frappe.cache().get_value(cache_key)
-        cached_version = frappe.cache().get_value(version_key)
-        current_version = self.get_membership_version(membership_id)
-        
-        if cached_data and cached_version and cached_version == current_version:
-            return cached_data
-        return None
 
-    def set_cached_membership_data(self, membership_id: str, data: Dict[str, Any]) -> None:
-        """Cache membership data with version"""
+    def rebuild_membership_version(self, membership_id: str) -> Optional[int]:
+        """Seed a missing version counter, only runs when the counter key is gone"""
+        if not frappe.db.exists("Membership", membership_id):
+            return None
+
+        # Seed from the clock so the rebuilt counter is ahead of any value handed out before the key was lost
+        redis = frappe.cache()
+        key = redis.make_key(self.get_version_counter_key(membership_id))
+        redis.set(key, time.time_ns() // 1000, nx=True)
+        return int(redis.get(key))
+
+    def bump_membership_version(self, membership_id: str) -> None:
+        """Atomically increment the version counter of a membership"""
+        redis = frappe.cache()
+        try:
+            redis.eval(BUMP_VERSION_SCRIPT, 1, redis.make_key(self.get_version_counter_key(membership_id)))
+        except Exception as e:
+            frappe.log_error(f"Error bumping membership version: {str(e)}")
+
+    def get_library_dependents_key(self, item_type: str, item_id: str) -> str:
+        """Get cache key for the set of membership:plan pairs using a library item"""
+        return f"library_dependents:{item_type}:{item_id}"
+
+    def get_plan_dependencies_key(self, plan_name: str) -> str:
+        """Get cache key for the set of library items a plan used when last indexed"""
+        return f"plan_library_deps:{plan_name}"
+
+    def update_library_dependents(self, plan_doc: Any, removed: bool = False) -> None:
+        """
+        Keep the reverse index from exercises and foods to the plans using them in sync with a plan,
+        once the transaction commits so a rolled back edit leaves the index as it was.
+        """
+        new_deps = set()
+        if not removed:
+            for day in range(1, 8):
+                new_deps.update(f"Exercise|{row.exercise}" for row in plan_doc.get(f"d{day}_e", []) if row.exercise)
+                new_deps.update(f"Food|{row.food}" for row in plan_doc.get(f"d{day}_f", []) if row.food)
+        frappe.db.after_commit.add(partial(
+            self.index_library_dependents, plan_doc.name, f"{plan_doc.membership}:{plan_doc.name}", new_deps
+        ))
+
+    def index_library_dependents(self, plan_name: str, member: str, new_deps: Set[str]) -> None:
+        """Move a plan between the dependents sets of the library items it stopped or started using"""
+        redis = frappe.cache()
+        deps_key = self.get_plan_dependencies_key(plan_name)
+        try:
+            # smembers prefixes the key itself, the raw pipeline below does not
+            old_deps = {dep.decode() for dep in redis.smembers(deps_key)}
+            pipeline = redis.pipeline(transaction=False)
+            for dep in old_deps - new_deps:
+                pipeline.srem(redis.make_key(self.get_library_dependents_key(*dep.split("|", 1))), member)
+            for dep in new_deps - old_deps:
+                pipeline.sadd(redis.make_key(self.get_library_dependents_key(*dep.split("|", 1))), member)
+            pipeline.delete(redis.make_key(deps_key))
+            if new_deps:
+                pipeline.sadd(redis.make_key(deps_key), *new_deps)
+            pipeline.execute()
+        except Exception as e:
+            frappe.log_error(f"Error updating library dependents: {str(e)}")
+
+    def get_library_dependents_marker_key(self) -> str:
+        """Get cache key marking that the reverse index covers every existing plan"""
+        return "library_dependents_indexed"
+
+    def rebuild_library_dependents(self) -> None:
+        """
+        Index the library items of every existing plan, e.g. after a deploy or a Redis flush.
+        Members are only added, so plans saved meanwhile are never dropped from the index.
+        """
+        rows = frappe.db.sql("""
+            SELECT p.name AS plan, p.membership, 'Exercise' AS item_type, e.exercise AS item
+            FROM `tabExercises` e
+            JOIN `tabPlan` p ON p.name = e.parent
+            WHERE e.parenttype = 'Plan' AND IFNULL(e.exercise, '') != ''
+            UNION
+            SELECT p.name, p.membership, 'Food', f.food
+            FROM `tabFoods` f
+            JOIN `tabPlan` p ON p.name = f.parent
+            WHERE f.parenttype = 'Plan' AND IFNULL(f.food, '') != ''
+        """, as_dict=True)
+
+        dependents = {}
+        plan_deps = {}
+        for row in rows:
+            dependents.setdefault((row.item_type, row.item), set()).add(f"{row.membership}:{row.plan}")
+            plan_deps.setdefault(row.plan, set()).add(f"{row.item_type}|{row.item}")
+
+        redis = frappe.cache()
+        pipeline = redis.pipeline(transaction=False)
+        for (item_type, item_id), members in dependents.items():
+            pipeline.sadd(redis.make_key(self.get_library_dependents_key(item_type, item_id)), *members)
+        for plan_name, deps in plan_deps.items():
+            pipeline.sadd(redis.make_key(self.get_plan_dependencies_key(plan_name)), *deps)
+        pipeline.set(redis.make_key(self.get_library_dependents_marker_key()), 1)
+        pipeline.execute()
+
+    def ensure_library_dependents(self) -> None:
+        """Rebuild the reverse index when Redis lost it, so library edits never miss a membership"""
+        redis = frappe.cache()
+        if not redis.exists(self.get_library_dependents_marker_key()):
+            self.rebuild_library_dependents()
+
+    def invalidate_library_dependents(self, item_type: str, item_id: str) -> None:
+        """Invalidate exactly the memberships and plan fragments embedding a library item once the transaction commits"""
+        frappe.db.after_commit.add(partial(self.evict_library_dependents, item_type, item_id))
+
+    def evict_library_dependents(self, item_type: str, item_id: str) -> None:
+        """Bump the memberships and drop the plan fragments embedding a library item"""
+        redis = frappe.cache()
+        try:
+            self.ensure_library_dependents()
+            members = [m.decode().split(":", 1) for m in redis.smembers(
+                self.get_library_dependents_key(item_type, item_id)
+            )]
+        except Exception as e:
+            frappe.log_error(f"Error reading library dependents: {str(e)}")
+            return
+        if not members:
+            return
+
+        plans = frappe.get_all(
+            "Plan",
+            filters={"name": ["in", list({plan for _, plan in members})]},
+            fields=["name", "modified"]
+        )
+
+        pipeline = redis.pipeline(transaction=False)
+        for membership in {membership for membership, _ in members}:
+            pipeline.eval(BUMP_VERSION_SCRIPT, 1, redis.make_key(self.get_version_counter_key(membership)))
+        for plan in plans:
+            pipeline.delete(redis.make_key(self.get_plan_fragment_key(plan.name, plan.modified)))
+        try:
+            pipeline.execute()
+        except Exception as e:
+            frappe.log_error(f"Error invalidating library dependents: {str(e)}")
+
+    def get_rebuild_lock_key(self, membership_id: str) -> str:
+        """Get cache key for the single-flight rebuild lock of a membership"""
+        return f"membership_rebuild_lock:{membership_id}"
+
+    def read_value(self, key: str) -> Any:
+        """Read a cached value straight from Redis, skipping the request-local copy get_value keeps"""
+        redis = frappe.cache()
+        value = redis.get(redis.make_key(key))
+        return pickle.loads(value) if value is not None else None
+
+    def get_cached_membership_entry(
+        self, membership_id: str, fresh: bool = False
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Get cached membership data and the version it was built from, current or not.
+        `fresh` reads Redis on every call, for polling a rebuild running in another worker.
+        """
+        get_value = self.read_value if fresh else frappe.cache().get_value
+        if use_compressed_membership_cache():
+            # Only the compressed response is stored, the data is read back from the newest envelope
+            entries = {
+                envelope: get_value(self.get_response_cache_key(membership_id, envelope))
+                for envelope in RESPONSE_ENVELOPES
+            }
+            entries = {envelope: cached for envelope, cached in entries.items() if cached}
+            if not entries:
+                return None, None
+            envelope = max(entries, key=lambda e: int(entries[e]['version'].rsplit('.', 1)[1]))
+            body = decompress_body(entries[envelope]['encoding'], entries[envelope]['body'])
+            return json.loads(body)[envelope], entries[envelope]['version']
+
+        cached_data = get_value(self.get_membership_cache_key(membership_id))
+        cached_version = get_value(self.get_plans_version_key(membership_id))
+        return cached_data, cached_version
+
+    def set_cached_membership_data(self, membership_id: str, data: Dict[str, Any], version: Optional[str] = None) -> None:
+        """Cache membership data with the version it was built from"""
         cache_key = self.get_membership_cache_key(membership_id)
         version_key = self.get_plans_version_key(membership_id)
-        current_version = self.get_membership_version(membership_id)
-        
-        if current_version:
+        current_version = version or self.get_membership_version(membership_id)
+
+        if current_version and use_compressed_membership_cache():
+            # Keep a single copy of the payload, serialized and compressed as it is served
+            envelope = get_response_envelope() if is_http_request() else RESPONSE_ENVELOPES[0]
+            encoding, body = compress_json(data, envelope)
+            self.set_cached_membership_response(membership_id, current_version, envelope, encoding, body)
+            frappe.cache().delete_value([cache_key, version_key])
+            self.set_membership_manifest(membership_id, current_version, build_membership_manifest(data))
+        elif current_version:
             frappe.cache().set_value(
                 cache_key, 
                 data, 
@@ -117,26 +286,181 @@ class MembershipCache:
                 current_version, 
                 expires_in_sec=self.MEMBERSHIP_CACHE_TIMEOUT
             )
+            self.set_membership_manifest(membership_id, current_version, build_membership_manifest(data))
+
+    def get_cached_membership_response(self, membership_id: str, version: str, envelope: str) -> Optional[Dict[str, Any]]:
+        """Get the compressed response bytes if they were built for this version"""
+        cached = frappe.cache().get_value(self.get_response_cache_key(membership_id, envelope))
+        if cached and cached.get('version') == version:
+            return cached
+        return None
+
+    def set_cached_membership_response(self, membership_id: str, version: str, envelope: str, encoding: str, body: bytes) -> None:
+        """Cache the compressed response bytes next to the version they were built for"""
+        frappe.cache().set_value(
+            self.get_response_cache_key(membership_id, envelope),
+            {'version': version, 'encoding': encoding, 'body': body},
+            expires_in_sec=self.MEMBERSHIP_CACHE_TIMEOUT
+        )
+
+    def get_stale_memberships(self, membership_ids: List[str]) -> List[str]:
+        """
+        Memberships whose payload for the current version is missing or expires before the next warm pass.
+        The manifest is stored with every payload, so its TTL stands for the payload's.
+        """
+        versions = {m: self.get_membership_version(m) for m in membership_ids}
+        versions = {m: version for m, version in versions.items() if version}
+        if not versions:
+            return []
+
+        redis = frappe.cache()
+        pipeline = redis.pipeline(transaction=False)
+        for membership_id, version in versions.items():
+            pipeline.ttl(redis.make_key(self.get_manifest_key(membership_id, version)))
+        try:
+            ttls = pipeline.execute()
+        except Exception as e:
+            frappe.log_error(f"Error reading membership payload expiry: {str(e)}")
+            return []
+        # -2 is a missing key, -1 a key without expiry
+        return [m for m, ttl in zip(versions, ttls) if ttl != -1 and ttl < self.WARM_AHEAD]
+
+    def get_membership_manifest(self, membership_id: str, version: str) -> Optional[Dict[str, Any]]:
+        """Get the manifest recorded for a membership version"""
+        if not version:
+            return None
+        return frappe.cache().get_value(self.get_manifest_key(membership_id, version))
+
+    def set_membership_manifest(self, membership_id: str, version: str, manifest: Dict[str, Any]) -> None:
+        """Record the manifest of a membership version so later deltas can diff against it"""
+        if version:
+            frappe.cache().set_value(
+                self.get_manifest_key(membership_id, version),
+                manifest,
+                expires_in_sec=self.MEMBERSHIP_CACHE_TIMEOUT
+            )
 
-    def get_cached_library_item(self, item_type: str, item_id: str) -> Optional[Dict[str, Any]]:
-        """Get cached library item (food/exercise)"""
-        cache_key = self.get_library_cache_key(item_type, item_id)
-        return frappe.cache().get_value(cache_key)
+    def get_cached_plan_fragment(self, plan_name: str, modified: Any) -> Optional[Dict[str, Any]]:
+        """Get cached processed plan for this exact plan revision"""
+        return frappe.cache().get_value(self.get_plan_fragment_key(plan_name, modified))
 
-    def set_cached_library_item(self, item_type: str, item_id: str, data: Dict[str, Any]) -> None:
-        """Cache library item with longer timeout"""
-        cache_key = self.get_library_cache_key(item_type, item_id)
+    def set_cached_plan_fragment(self, plan_name: str, modified: Any, data: Dict[str, Any]) -> None:
+        """Cache processed plan, superseded revisions simply expire"""
         frappe.cache().set_value(
-            cache_key,
+            self.get_plan_fragment_key(plan_name, modified),
             data,
-            expires_in_sec=self.LIBRARY_CACHE_TIMEOUT
+            expires_in_sec=self.MEMBERSHIP_CACHE_TIMEOUT
         )
 
+    def get_library_redis_key(self, item_type: str, item_id: str) -> str:
+        """Get the site-prefixed Redis key of a library item, also used as its in-process cache key"""
+        key = frappe.cache().make_key(self.get_library_cache_key(item_type, item_id))
+        return key.decode() if isinstance(key, bytes) else key
+
+    def get_cached_library_items(self, item_type: str, item_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several cached library items from the in-process cache, then a single MGET for the rest"""
+        ensure_invalidation_listener()
+
+        items = {}
+        missing_keys = {}
+        for item_id in item_ids:
+            key = self.get_library_redis_key(item_type, item_id)
+            data = library_cache.get(key)
+            if data is not None:
+                items[item_id] = data
+            else:
+                missing_keys[item_id] = key
+
+        if not missing_keys:
+            return items
+
+        try:
+            values = frappe.cache().mget(list(missing_keys.values()))
+        except Exception as e:
+            frappe.log_error(f"Error reading library items from cache: {str(e)}")
+            return items
+
+        for (item_id, key), value in zip(missing_keys.items(), values):
+            if value is not None:
+                items[item_id] = pickle.loads(value)
+                library_cache.set(key, items[item_id])
+
+        return items
+
+    def set_cached_library_items(self, item_type: str, items: Dict[str, Dict[str, Any]]) -> None:
+        """Cache several library items in-process and in Redis with a single pipelined round trip"""
+        if not items:
+            return
+
+        pipeline = frappe.cache().pipeline(transaction=False)
+        for item_id, data in items.items():
+            key = self.get_library_redis_key(item_type, item_id)
+            library_cache.set(key, data)
+            pipeline.set(key, pickle.dumps(data), ex=self.LIBRARY_CACHE_TIMEOUT)
+        try:
+            pipeline.execute()
+        except Exception as e:
+            frappe.log_error(f"Error writing library items to cache: {str(e)}")
+
+    def invalidate_library_item(self, item_type: str, item_id: str) -> None:
+        """Drop a library item from Redis and from the in-process cache of every worker"""
+        self.invalidate_library_items(item_type, [item_id])
+
+    def invalidate_library_items(self, item_type: str, item_ids: List[str]) -> None:
+        """Drop several library items once the transaction commits, so no worker refills them from the old rows"""
+        if item_ids:
+            frappe.db.after_commit.add(partial(self.evict_library_items, item_type, list(item_ids)))
+
+    def evict_library_items(self, item_type: str, item_ids: List[str]) -> None:
+        """Drop several library items with one DEL and one invalidation message"""
+        keys = [self.get_library_redis_key(item_type, item_id) for item_id in item_ids]
+        frappe.cache().delete(*keys)
+        frappe.cache().delete_value(self.get_library_snapshot_key())
+        publish_library_invalidation(keys)
+
+    def acquire_rebuild_lock(self, membership_id: str) -> Optional[str]:
+        """Try to become the single worker rebuilding a membership, returns the lock token"""
+        token = frappe.generate_hash(length=16)
+        redis = frappe.cache()
+        try:
+            if redis.set(redis.make_key(self.get_rebuild_lock_key(membership_id)), token,
+                         nx=True, ex=self.REBUILD_LOCK_TIMEOUT):
+                return token
+        except Exception as e:
+            frappe.log_error(f"Error acquiring membership rebuild lock: {str(e)}")
+        return None
+
+    def release_rebuild_lock(self, membership_id: str, token: str) -> None:
+        """Release the rebuild lock if we still hold it"""
+        redis = frappe.cache()
+        try:
+            redis.eval(
+                "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0",
+                1,
+                redis.make_key(self.get_rebuild_lock_key(membership_id)),
+                token
+            )
+        except Exception as e:
+            frappe.log_error(f"Error releasing membership rebuild lock: {str(e)}")
+
+    def wait_for_membership_data(self, membership_id: str, version: str) -> Optional[Dict[str, Any]]:
+        """Wait briefly for the worker holding the rebuild lock to cache this version"""
+        deadline = time.monotonic() + self.REBUILD_WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            # get_value would keep answering with the miss it memoized before the wait
+            cached_data, cached_version = self.get_cached_membership_entry(membership_id, fresh=True)
+            if cached_data and cached_version == version:
+                return cached_data
+        return None
+
     def invalidate_membership_cache(self, membership_id: str) -> None:
-        """Invalidate membership related cache"""
-        cache_key = self.get_membership_cache_key(membership_id)
-        version_key = self.get_plans_version_key(membership_id)
-        frappe.cache().delete_value([cache_key, version_key])
+        """
+        Invalidate membership related cache by bumping its version once the transaction commits.
+        The previous payload stays cached so it can be served stale while one worker rebuilds.
+        """
+        # Bumping before the commit would let a reader rebuild from the old rows under the new version
+        frappe.db.after_commit.add(partial(self.bump_membership_version, membership_id))
 
     def invalidate_client_caches(self, client_id: str) -> None:
         """Invalidate all membership caches for a client"""
@@ -148,42 +472,147 @@ class MembershipCache:
         for membership in memberships:
             self.invalidate_membership_cache(membership.name)
 
-def extract_base_nutrition(food_doc: Any, nutrient_mappings: Dict[str, List[str]]) -> Optional[Dict[str, NutritionFact]]:
+    def invalidate_membership_caches(self, membership_ids: List[str]) -> None:
+        """Bump the versions of several memberships in one pipelined round trip once the transaction commits"""
+        if membership_ids:
+            frappe.db.after_commit.add(partial(self.bump_membership_versions, list(membership_ids)))
+
+    def bump_membership_versions(self, membership_ids: List[str]) -> None:
+        """Atomically increment the version counters of several memberships"""
+        redis = frappe.cache()
+        pipeline = redis.pipeline(transaction=False)
+        for membership_id in membership_ids:
+            pipeline.eval(BUMP_VERSION_SCRIPT, 1, redis.make_key(self.get_version_counter_key(membership_id)))
+        try:
+            pipeline.execute()
+        except Exception as e:
+            frappe.log_error(f"Error bumping membership versions: {str(e)}")
+
+    def invalidate_clients_caches(self, client_ids: List[str]) -> None:
+        """Invalidate the membership caches of several clients with one query"""
+        if not client_ids:
+            return
+        self.invalidate_membership_caches(frappe.get_all(
+            "Membership",
+            filters={"client": ["in", list(client_ids)]},
+            pluck="name"
+        ))
+
+def use_compressed_membership_cache() -> bool:
+    """Whether membership payloads are cached as compressed responses instead of pickled dicts"""
+    return bool(frappe.db.get_single_value("PT Settings", "compress_membership_cache"))
+
+def get_payload_digest(value: Any) -> str:
+    """Stable digest of a JSON-serializable payload fragment"""
+    return hashlib.md5(frappe.as_json(value, indent=None).encode()).hexdigest()
+
+def build_membership_manifest(response_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Digest every plan, reference entry and client field of a membership payload"""
+    references = response_data.get('references', {})
+    return {
+        'membership': get_payload_digest(response_data.get('membership')),
+        'client': {
+            field: get_payload_digest(value)
+            for field, value in response_data.get('client', {}).items()
+        },
+        'plans': {
+            plan['plan_name']: get_payload_digest(plan)
+            for plan in response_data.get('plans', [])
+        },
+        'references': {
+            section: ({key: get_payload_digest(entry) for key, entry in entries.items()}
+                      if isinstance(entries, dict) else get_payload_digest(entries))
+            for section, entries in references.items()
+        }
+    }
+
+def diff_membership_payload(
+    response_data: Dict[str, Any],
+    old_manifest: Dict[str, Any],
+    new_manifest: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Build the part of a membership payload that changed between two manifests"""
+    old_plans = old_manifest.get('plans', {})
+    old_references = old_manifest.get('references', {})
+    old_client = old_manifest.get('client', {})
+
+    references = {}
+    deleted_references = {}
+    for section, entries in new_manifest['references'].items():
+        if not isinstance(entries, dict):
+            # Sections sent as a whole, such as library IDs and the snapshot hash
+            if old_references.get(section) != entries:
+                references[section] = response_data['references'][section]
+            continue
+
+        old_entries = old_references.get(section)
+        if not isinstance(old_entries, dict):
+            old_entries = {}
+        references[section] = {
+            key: response_data['references'][section][key]
+            for key, digest in entries.items()
+            if old_entries.get(key) != digest
+        }
+        deleted_references[section] = [key for key in old_entries if key not in entries]
+
+    return {
+        'membership': (response_data['membership']
+                       if old_manifest.get('membership') != new_manifest['membership'] else None),
+        'client': {
+            field: response_data['client'][field]
+            for field, digest in new_manifest['client'].items()
+            if old_client.get(field) != digest
+        },
+        'plans': [
+            plan for plan in response_data['plans']
+            if old_plans.get(plan['plan_name']) != new_manifest['plans'][plan['plan_name']]
+        ],
+        'deleted_plans': [name for name in old_plans if name not in new_manifest['plans']],
+        'references': references,
+        'deleted_references': deleted_references
+    }
+
+def extract_base_nutrition(
+    food_doc: Any,
+    nutrient_mappings: Optional[Dict[str, List[str]]] = None
+) -> Optional[Dict[str, NutritionFact]]:
     """Extract base nutrition facts (per 100g) from food document"""
     try:
         facts = food_doc.get('nutritional_facts')
         if not facts:
             return None
 
-        facts_lookup = {fact.nutrient: fact for fact in facts}
         base_facts = {}
-
-        for macro_name, variations in nutrient_mappings.items():
-            for nutrient in variations:
-                if fact := facts_lookup.get(nutrient):
-                    value = fact.value
-                    if macro_name == 'energy' and fact.unit.lower() != 'kcal':
-                        value /= KCAL_TO_KJ
-                    base_facts[macro_name] = {
-                        'value': round(value, 1),
-                        'unit': 'kcal' if macro_name == 'energy' else fact.unit
-                    }
-                    break
+        for macro_name, fact in get_nutrient_resolver(nutrient_mappings).resolve_facts(facts).items():
+            value = fact.value
+            if macro_name == 'energy' and (fact.unit or '').lower() != 'kcal':
+                value /= KCAL_TO_KJ
+            base_facts[macro_name] = {
+                'value': round(value, 1),
+                'unit': 'kcal' if macro_name == 'energy' else fact.unit
+            }
 
         return base_facts
     except Exception as e:
         frappe.log_error(f"Error extracting base nutrition for food {food_doc.name}: {str(e)}")
         return None
 
-def calculate_nutrition_for_amount(base_nutrition: Dict[str, NutritionFact], amount: float) -> Dict[str, NutritionFact]:
-    """Calculate nutrition facts for a specific amount based on base nutrition (per 100g)"""
-    amount_ratio = amount / 100
+def resolve_food_macros(food_doc: Any) -> Dict[str, float]:
+    """Resolve the materialized per 100 g macro columns of a food from its nutritional facts"""
+    base_nutrition = extract_base_nutrition(food_doc) or {}
     return {
-        nutrient: {
-            'value': round(facts['value'] * amount_ratio, 1),
-            'unit': facts['unit']
-        }
-        for nutrient, facts in base_nutrition.items()
+        column: base_nutrition[macro]['value'] if macro in base_nutrition else 0
+        for macro, column in MACRO_COLUMNS.items()
+    }
+
+def get_base_nutrition(food_doc: Any) -> Optional[Dict[str, NutritionFact]]:
+    """Base nutrition facts (per 100g) read from the materialized macro columns of a food"""
+    values = {macro: food_doc.get(column) or 0 for macro, column in MACRO_COLUMNS.items()}
+    if not any(values.values()):
+        return None
+    return {
+        macro: {'value': round(value, 1), 'unit': DEFAULT_UNITS[macro]}
+        for macro, value in values.items()
     }
 
 def process_exercise_data(exercise_doc: Any) -> Dict[str, Any]:
@@ -203,30 +632,9 @@ def process_exercise_data(exercise_doc: Any) -> Dict[str, Any]:
         'secondary_muscles': [{'muscle': m.muscle} for m in exercise_doc.secondary_muscles]
     }
 
-def process_exercise_data_cached(exercise_name: str) -> Dict[str, Any]:
-    """Cached version of exercise data processing"""
-    cache = MembershipCache()
-    
-    cached_data = cache.get_cached_library_item("Exercise", exercise_name)
-    if cached_data:
-        return cached_data
-
-    exercise_doc = frappe.get_doc("Exercise", exercise_name)
-    processed_data = process_exercise_data(exercise_doc)
-    cache.set_cached_library_item("Exercise", exercise_name, processed_data)
-    
-    return processed_data
-
-def process_food_reference_data_cached(food_id: str) -> Dict[str, Any]:
-    """Cached version of food reference data processing"""
-    cache = MembershipCache()
-    
-    cached_data = cache.get_cached_library_item("Food", food_id)
-    if cached_data:
-        return cached_data
-
-    food_doc = frappe.get_doc("Food", food_id)
-    base_nutrition = extract_base_nutrition(food_doc, get_nutrient_mappings())
+def process_food_reference_data(food_doc: Any) -> Dict[str, Any]:
+    """Process food data for reference"""
+    base_nutrition = get_base_nutrition(food_doc)
     processed_data = {
         'title': food_doc.title,
         'image': food_doc.image,
@@ -235,16 +643,102 @@ def process_food_reference_data_cached(food_id: str) -> Dict[str, Any]:
     }
     if base_nutrition:
         processed_data['nutrition_per_100g'] = base_nutrition
-    cache.set_cached_library_item("Food", food_id, processed_data)
-    
     return processed_data
 
-def process_food_instance(food_item: Any, food_reference_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Process food instance with calculated nutrition"""
-    base_nutrition = food_reference_data.get('nutrition_per_100g')
-    nutrition = (calculate_nutrition_for_amount(base_nutrition, float(food_item.amount))
-                if base_nutrition else None)
-    
+def group_child_rows(doctype: str, parenttype: str, parents: Optional[List[str]], fields: List[str]) -> Dict[str, List[Any]]:
+    """Load child rows of many parents (all parents when None) in one query, grouped by parent"""
+    filters = {"parenttype": parenttype}
+    if parents is not None:
+        filters["parent"] = ["in", parents]
+    rows = frappe.get_all(
+        doctype,
+        filters=filters,
+        fields=["parent", *fields],
+        order_by="parent asc, idx asc"
+    )
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.parent, []).append(row)
+    return grouped
+
+def load_exercise_references(exercise_names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Load and process exercises (all when None) with one query for the parents and one for secondary muscles"""
+    exercises = frappe.get_all(
+        "Exercise",
+        filters={"name": ["in", exercise_names]} if exercise_names is not None else None,
+        fields=["name", "category", "equipment", "force", "mechanic", "level", "primary_muscle",
+                "thumbnail", "starting", "ending", "video", "instructions"]
+    )
+    muscles = group_child_rows("Muscles", "Exercise", exercise_names, ["muscle"])
+
+    processed = {}
+    for exercise in exercises:
+        exercise.secondary_muscles = muscles.get(exercise.name, [])
+        processed[exercise.name] = process_exercise_data(exercise)
+    return processed
+
+def load_food_references(food_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Load and process foods (all when None) in one query, macros come from the materialized columns"""
+    foods = frappe.get_all(
+        "Food",
+        filters={"name": ["in", food_ids]} if food_ids is not None else None,
+        fields=["name", "title", "image", "category", "description", *MACRO_COLUMNS.values()]
+    )
+    return {food.name: process_food_reference_data(food) for food in foods}
+
+def load_food_micros(food_ids: List[str]) -> Dict[str, Dict[str, float]]:
+    """Load the micronutrient profiles of several foods with one query for the facts"""
+    foods = frappe.get_all("Food", filters={"name": ["in", food_ids]}, pluck="name")
+    facts = group_child_rows("Nutritional Facts", "Food", foods, ["nutrient", "value"]) if foods else {}
+    return {
+        food: {fact.nutrient: fact.value for fact in facts.get(food, []) if fact.nutrient not in NUTRIENTS}
+        for food in foods
+    }
+
+LIBRARY_LOADERS = {
+    "Exercise": load_exercise_references,
+    "Food": load_food_references,
+    "Micros": load_food_micros
+}
+
+def get_library_snapshot_data() -> Dict[str, Any]:
+    """Get the shared exercise and food library with its content hash, built once and cached"""
+    cache = MembershipCache()
+    snapshot = frappe.cache().get_value(cache.get_library_snapshot_key())
+    if snapshot:
+        return snapshot
+
+    library = {
+        'exercises': load_exercise_references(),
+        'foods': load_food_references()
+    }
+    snapshot = {'hash': get_payload_digest(library), 'library': library}
+    frappe.cache().set_value(
+        cache.get_library_snapshot_key(),
+        snapshot,
+        expires_in_sec=cache.LIBRARY_CACHE_TIMEOUT
+    )
+    return snapshot
+
+def resolve_library_references(item_type: str, item_ids: Set[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Resolve library references in bulk: one MGET for all keys,
+    bulk SQL for the misses and one pipelined write back
+    """
+    item_ids = [item_id for item_id in item_ids if item_id]
+    cache = MembershipCache()
+
+    items = cache.get_cached_library_items(item_type, item_ids)
+    missing = [item_id for item_id in item_ids if item_id not in items]
+    if missing:
+        loaded = LIBRARY_LOADERS[item_type](missing)
+        cache.set_cached_library_items(item_type, loaded)
+        items.update(loaded)
+
+    return items
+
+def process_food_instance(food_item: Any, nutrition: Optional[Dict[str, NutritionFact]]) -> Dict[str, Any]:
+    """Process food instance with its nutrition for the amount, as computed by NutritionEngine"""
     return {
         'meal': food_item.meal,
         'ref': food_item.food,
@@ -270,6 +764,33 @@ def process_exercise_performance(performance_docs: List[Any]) -> Dict[str, List[
     
     return performance_data
 
+def get_performance_history_limit() -> int:
+    """Number of most recent performance entries kept per exercise"""
+    limit = frappe.db.get_single_value("PT Settings", "performance_history_limit")
+    return int(limit) if limit else DEFAULT_PERFORMANCE_HISTORY_LIMIT
+
+def get_performance_history(client: str, exercises: Set[str], limit: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Get the last `limit` logged sets per exercise for a single client, newest first"""
+    if not client or not exercises:
+        return {}
+
+    performance_docs = frappe.db.sql("""
+        SELECT exercise, weight, reps, date
+        FROM (
+            SELECT exercise, weight, reps, date, creation,
+                ROW_NUMBER() OVER (PARTITION BY exercise ORDER BY creation DESC) AS row_num
+            FROM `tabPerformance Log`
+            WHERE parenttype = 'Client'
+                AND parentfield = 'exercise_performance'
+                AND parent = %(client)s
+                AND exercise IN %(exercises)s
+        ) ranked
+        WHERE row_num <= %(limit)s
+        ORDER BY exercise, creation DESC
+    """, {"client": client, "exercises": tuple(exercises), "limit": limit}, as_dict=True)
+
+    return process_exercise_performance(performance_docs)
+
 def process_exercise_instance(exercise_item: Any, performance_data: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
     """Process exercise instance data with performance references"""
     return {
@@ -310,18 +831,6 @@ def process_day_exercises(exercises: List[Any], performance_data: Dict[str, List
 
     return processed_exercises
 
-def calculate_daily_totals(foods: List[Dict[str, Any]]) -> DailyTotals:
-    """Calculate nutrition totals for a day"""
-    totals = {nutrient: {'value': 0, 'unit': DEFAULT_UNITS[nutrient]} for nutrient in NUTRIENTS}
-    
-    for food in foods:
-        if nutrition := food.get('nutrition'):
-            for nutrient in NUTRIENTS:
-                if nutrient in nutrition:
-                    totals[nutrient]['value'] += nutrition[nutrient]['value']
-    
-    return {n: {'value': round(t['value'], 1), 'unit': t['unit']} for n, t in totals.items()}
-
 def process_plan_data(plan_doc: Any) -> Dict[str, Any]:
     """Process plan data with optimized structure"""
     return {
@@ -347,29 +856,24 @@ def process_plan_data(plan_doc: Any) -> Dict[str, Any]:
 def process_plan_day(
     plan_doc: Any,
     day: int,
-    food_references: Dict[str, Any],
     exercise_references: Dict[str, Any],
-    performance_data: Dict[str, List[Dict[str, Any]]]
+    performance_data: Dict[str, List[Dict[str, Any]]],
+    nutrition: Tuple[List[Optional[Dict[str, NutritionFact]]], DailyTotals]
 ) -> Dict[str, Any]:
-    """Process a single day of a plan efficiently with performance data"""
+    """Process a single day of a plan with performance data and its (per-food, totals) nutrition"""
     day_exercises = plan_doc.get(f"d{day}_e", [])
     day_foods = plan_doc.get(f"d{day}_f", [])
-
-    processed_foods = [
-        process_food_instance(food, food_references[food.food])
-        for food in day_foods
-    ]
+    food_nutrition, totals = nutrition
 
     return {
         'exercises': process_day_exercises(day_exercises, performance_data),
-        'foods': processed_foods,
-        'totals': calculate_daily_totals(processed_foods)
+        'foods': [process_food_instance(food, values) for food, values in zip(day_foods, food_nutrition)],
+        'totals': totals
     }
 
-def process_plans_batch(plan_docs: List[Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+def process_plans_batch(plan_docs: List[Any], client: Optional[str] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
     """Process multiple plans efficiently in batch"""
     reference_data = {'exercises': {}, 'foods': {}, 'performance': {}}
-    processed_plans = []
     
     # Collect unique items efficiently
     all_exercises = {
@@ -386,56 +890,153 @@ def process_plans_batch(plan_docs: List[Any]) -> Tuple[Dict[str, Any], List[Dict
         for food in plan.get(f"d{day}_f", [])
     }
 
-    # Process reference data with caching
-    for exercise_name in all_exercises:
-        reference_data['exercises'][exercise_name] = process_exercise_data_cached(exercise_name)
-    
-    for food_id in all_foods:
-        reference_data['foods'][food_id] = process_food_reference_data_cached(food_id)
-
-    # Process exercise performance data
-    performance_docs = frappe.get_all(
-        "Performance Log",
-        filters={"exercise": ["in", list(all_exercises)]},
-        fields=["exercise", "weight", "reps", "date", "creation"],
-        order_by="creation desc"  # or "creation asc" for ascending order
+    # Resolve reference data in bulk
+    reference_data['exercises'] = resolve_library_references("Exercise", all_exercises)
+    reference_data['foods'] = resolve_library_references("Food", all_foods)
+
+    # Process the client's recent exercise performance
+    reference_data['performance'] = get_performance_history(
+        client,
+        all_exercises,
+        get_performance_history_limit()
     )
-    for doc in performance_docs:
-        if doc.exercise not in reference_data['performance']:
-            reference_data['performance'][doc.exercise] = []
-        reference_data['performance'][doc.exercise].append({
-            'weight': doc.weight,
-            'reps': doc.reps,
-            'date': doc.date
-        })
 
-    # Process plans efficiently
-    for plan_doc in plan_docs:
+    # Reuse fragments of unchanged plans
+    cache = MembershipCache()
+    fragments = {
+        plan_doc.name: cache.get_cached_plan_fragment(plan_doc.name, plan_doc.modified)
+        for plan_doc in plan_docs
+    }
+    stale_plans = [plan_doc for plan_doc in plan_docs if not fragments[plan_doc.name]]
+
+    # Per-food nutrition and daily totals of every day of every rebuilt plan in one engine pass
+    engine = NutritionEngine(base_nutrition_from_references(reference_data['foods']))
+    daily_nutrition = engine.daily_nutrition({
+        (plan_doc.name, day): daily_items(plan_doc, day)
+        for plan_doc in stale_plans
+        for day in range(1, 8)
+    }, DEFAULT_UNITS)
+
+    for plan_doc in stale_plans:
         plan_data = process_plan_data(plan_doc)
         plan_data['days'] = {
             f"day_{day}": process_plan_day(
                 plan_doc, 
                 day, 
-                reference_data['foods'],
                 reference_data['exercises'],
-                reference_data['performance']
+                reference_data['performance'],
+                daily_nutrition[(plan_doc.name, day)]
             )
             for day in range(1, 8)
         }
-        processed_plans.append(plan_data)
+        cache.set_cached_plan_fragment(plan_doc.name, plan_doc.modified, plan_data)
+        fragments[plan_doc.name] = plan_data
+
+    processed_plans = [fragments[plan_doc.name] for plan_doc in plan_docs]
 
     return reference_data, processed_plans
 
+def get_completed_plans_window() -> int:
+    """Number of completed plans sent with the membership payload, 0 sends all plans"""
+    return int(frappe.db.get_single_value("PT Settings", "membership_completed_plans") or 0)
+
+def select_plan_window(plan_docs: List[Any], completed_plans: int) -> List[Any]:
+    """Keep the active plans, the next scheduled plan and the last completed plans"""
+    # Start and end are optional, plans without them sort last
+    scheduled = sorted((p for p in plan_docs if p.status == "Scheduled"),
+                       key=lambda p: (p.start is None, p.start or ""))
+    completed = sorted((p for p in plan_docs if p.status == "Completed"),
+                       key=lambda p: (p.end is not None, p.end or ""), reverse=True)
+
+    selected = {p.name for p in plan_docs if p.status == "Active"}
+    selected.update(p.name for p in scheduled[:1])
+    selected.update(p.name for p in completed[:completed_plans])
+
+    return [p for p in plan_docs if p.name in selected]
+
 @frappe.whitelist(allow_guest=True)
-def get_membership(membership: str) -> Dict[str, Any]:
+def get_membership(membership: str) -> Any:
+    """Get membership data, answering with 304 when the client already holds the current version"""
+    try:
+        cache = MembershipCache()
+        etag = None
+        if is_http_request():
+            version = cache.get_membership_version(membership)
+            if version:
+                etag = make_etag("membership", membership, version)
+                if request_matches_etag(etag):
+                    return not_modified_response(etag)
+
+        use_compressed_cache = etag and use_compressed_membership_cache()
+        if use_compressed_cache:
+            envelope = get_response_envelope()
+            cached = cache.get_cached_membership_response(membership, version, envelope)
+            if cached:
+                return encoded_json_response(cached['encoding'], cached['body'], etag)
+
+        response_data, data_version = load_membership_data(membership)
+        if not etag or 'plans' not in response_data:
+            return response_data
+
+        if data_version != version:
+            # Stale payload served while another worker rebuilds, tag it with its own version
+            version = data_version
+            etag = make_etag("membership", membership, version)
+
+        if use_compressed_cache:
+            # The rebuild stored the response already unless it was read from the other envelope
+            cached = cache.get_cached_membership_response(membership, version, envelope)
+            if cached:
+                return encoded_json_response(cached['encoding'], cached['body'], etag)
+            encoding, body = compress_json(response_data)
+            cache.set_cached_membership_response(membership, version, envelope, encoding, body)
+            return encoded_json_response(encoding, body, etag)
+        return json_response(response_data, etag)
+    except Exception as e:
+        frappe.log_error(f"Error in get_membership: {str(e)}")
+        return {"message": f"An error occurred: {str(e)}"}
+
+def get_membership_data(membership: str) -> Dict[str, Any]:
     """Get comprehensive membership information with optimized data structure"""
+    return load_membership_data(membership)[0]
+
+def load_membership_data(membership: str) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Get membership data and the version it belongs to.
+    Only one worker rebuilds a stale payload, the others serve the previous one or wait for the rebuild.
+    """
+    try:
+        cache = MembershipCache()
+        version = cache.get_membership_version(membership)
+
+        cached_data, cached_version = cache.get_cached_membership_entry(membership)
+        if cached_data and cached_version and cached_version == version:
+            return cached_data, version
+
+        token = cache.acquire_rebuild_lock(membership)
+        if not token:
+            if cached_data and cached_version:
+                return cached_data, cached_version
+            fresh_data = cache.wait_for_membership_data(membership, version) if version else None
+            if fresh_data:
+                return fresh_data, version
+
+        try:
+            return build_membership_data(membership, version), version
+        finally:
+            if token:
+                cache.release_rebuild_lock(membership, token)
+    except Exception as e:
+        frappe.log_error(f"Error in load_membership_data: {str(e)}")
+        return {"message": f"An error occurred: {str(e)}"}, None
+
+def build_membership_data(membership: str, version: Optional[str]) -> Dict[str, Any]:
+    """
+    Build and cache the membership payload.
+    `version` must be read before loading, so data built from older rows is never stored under a newer version.
+    """
     try:
         cache = MembershipCache()
-        
-        # Try to get cached membership data
-        cached_data = cache.get_cached_membership_data(membership)
-        if (cached_data):
-            return cached_data
 
         # Fetch and validate core documents
         membership_doc = frappe.get_doc("Membership", membership)
@@ -446,16 +1047,24 @@ def get_membership(membership: str) -> Dict[str, Any]:
         if not client_doc.enabled:
             return {"message": "Client is disabled."}
 
-        # Get all plans
-        plans = frappe.get_all(
-            "Plan",
+        # Get plans, then their day tables in a constant number of queries
+        plan_docs = load_plans(
             filters={"membership": membership, "status": ["!=", "Scheduledx"]},
-            fields=["*"]
+            child_doctypes=()
         )
-        plan_docs = [frappe.get_doc("Plan", plan.name) for plan in plans]
+        completed_plans = get_completed_plans_window()
+        if completed_plans:
+            plan_docs = select_plan_window(plan_docs, completed_plans)
+        attach_plan_children(plan_docs)
 
         # Process plans in batch
-        reference_data, processed_plans = process_plans_batch(plan_docs)
+        reference_data, processed_plans = process_plans_batch(plan_docs, membership_doc.client)
+
+        # Point at the shared library snapshot instead of embedding library entries
+        if frappe.db.get_single_value("PT Settings", "shared_library_snapshot"):
+            reference_data['exercises'] = sorted(reference_data['exercises'])
+            reference_data['foods'] = sorted(reference_data['foods'])
+            reference_data['library'] = get_library_snapshot_data()['hash']
 
         # Build response
         response_data = {
@@ -468,7 +1077,7 @@ def get_membership(membership: str) -> Dict[str, Any]:
                 'active': membership_doc.active,
             },
             'client': {
-                **{k: v for k, v in client_doc.as_dict().items() if k not in {'exercise_performance', 'target_proteins', 'target_carbs', 'target_fats', 'target_energy', 'target_water'}},
+                **{k: v for k, v in client_doc.as_dict().items() if k not in {'exercise_performance', 'target_proteins', 'target_carbs', 'target_fats', 'target_energy', 'target_water', 'logged_exercises_count', 'early_workouts_count', 'late_workouts_count'}},
                 'current_weight': client_doc.weight[-1].weight if client_doc.weight else None,
                 'weight': [{'weight': w.weight, 'date': w.date} for w in client_doc.weight]
             },
@@ -477,23 +1086,197 @@ def get_membership(membership: str) -> Dict[str, Any]:
         }
 
         # Cache the response
-        cache.set_cached_membership_data(membership, response_data)
+        cache.set_cached_membership_data(membership, response_data, version)
         
         return response_data
     except Exception as e:
-        frappe.log_error(f"Error in get_membership: {str(e)}")
+        frappe.log_error(f"Error in build_membership_data: {str(e)}")
         return {"message": f"An error occurred: {str(e)}"}
 
+@frappe.whitelist(allow_guest=True)
+def get_membership_delta(membership: str, since_version: Optional[str] = None) -> Dict[str, Any]:
+    """Get only the plans, references and client fields that changed since a known version"""
+    try:
+        cache = MembershipCache()
+
+        # The no-change path is a single GET, the payload is only loaded when something changed
+        current_version = cache.get_membership_version(membership)
+        if since_version and current_version and since_version == current_version:
+            return {'version': current_version, 'full': False, 'unchanged': True}
+
+        response_data, current_version = load_membership_data(membership)
+        if 'plans' not in response_data:
+            return response_data
+
+        if since_version and since_version == current_version:
+            # A stale payload was served while another worker rebuilds
+            return {'version': current_version, 'full': False, 'unchanged': True}
+
+        old_manifest = cache.get_membership_manifest(membership, since_version)
+        if not old_manifest:
+            # Unknown or expired version, the client has to resync from scratch
+            return {'version': current_version, 'full': True, 'data': response_data}
+
+        new_manifest = (cache.get_membership_manifest(membership, current_version)
+                        or build_membership_manifest(response_data))
+        delta = diff_membership_payload(response_data, old_manifest, new_manifest)
+
+        # Plans that left the plans window still exist, they can be paged in with get_membership_plans
+        existing = set(frappe.get_all(
+            "Plan",
+            filters={"membership": membership, "name": ["in", delta['deleted_plans']]},
+            pluck="name"
+        )) if delta['deleted_plans'] else set()
+        delta['out_of_window_plans'] = [name for name in delta['deleted_plans'] if name in existing]
+        delta['deleted_plans'] = [name for name in delta['deleted_plans'] if name not in existing]
+
+        return {
+            'version': current_version,
+            'full': False,
+            'unchanged': False,
+            **delta
+        }
+    except Exception as e:
+        frappe.log_error(f"Error in get_membership_delta: {str(e)}")
+        return {"message": f"An error occurred: {str(e)}"}
+
+@frappe.whitelist(allow_guest=True)
+def get_membership_plans(
+    membership: str,
+    before: Optional[str] = None,
+    before_name: Optional[str] = None,
+    limit: int = 10
+) -> Dict[str, Any]:
+    """
+    Get completed plans older than the (`before`, `before_name`) cursor, newest first, with their references.
+    The cursor is the start date and name of the last plan of the previous page.
+    """
+    try:
+        membership_doc = frappe.get_doc("Membership", membership)
+        if not membership_doc.active:
+            return {"message": "Membership is not active."}
+
+        limit = max(1, min(int(limit), 50))
+
+        # Keyset on (start, name) so plans sharing the boundary start date are not skipped,
+        # one extra row tells whether there is more history to page through
+        names = frappe.db.sql_list("""
+            SELECT name FROM `tabPlan`
+            WHERE membership = %(membership)s AND status = 'Completed'
+                AND (%(before)s IS NULL OR (`start`, name) < (%(before)s, %(before_name)s))
+            ORDER BY `start` DESC, name DESC
+            LIMIT %(limit)s
+        """, {
+            "membership": membership,
+            "before": frappe.utils.getdate(before) if before else None,
+            "before_name": before_name or "",
+            "limit": limit + 1
+        })
+        has_more = len(names) > limit
+        names = names[:limit]
+
+        plan_docs = load_plans(filters={"name": ["in", names]}, order_by="start desc, name desc") if names else []
+
+        reference_data, processed_plans = process_plans_batch(plan_docs, membership_doc.client)
+
+        return {
+            'plans': processed_plans,
+            'references': reference_data,
+            'has_more': has_more,
+            'before': plan_docs[-1].start if plan_docs else None,
+            'before_name': plan_docs[-1].name if plan_docs else None
+        }
+    except Exception as e:
+        frappe.log_error(f"Error in get_membership_plans: {str(e)}")
+        return {"message": f"An error occurred: {str(e)}"}
+
+@frappe.whitelist(allow_guest=True)
+def get_library_snapshot(snapshot_hash: Optional[str] = None) -> Any:
+    """
+    Get the exercise and food library shared by all memberships.
+    Requests naming the current hash are cacheable by browsers and CDNs for good.
+    """
+    try:
+        snapshot = get_library_snapshot_data()
+        if not is_http_request():
+            return snapshot
+
+        etag = make_etag("library", snapshot['hash'])
+        cache_control = ("public, max-age=31536000, immutable"
+                         if snapshot_hash == snapshot['hash'] else "public, no-cache")
+        if request_matches_etag(etag):
+            return not_modified_response(etag, cache_control)
+        return json_response(snapshot, etag, cache_control)
+    except Exception as e:
+        frappe.log_error(f"Error in get_library_snapshot: {str(e)}")
+        return {"message": f"An error occurred: {str(e)}"}
+
+def warm_membership_cache(membership: str) -> None:
+    """Background job rebuilding the cached payload of a membership when it is outdated or about to expire"""
+    if not frappe.db.get_value("Membership", membership, "active"):
+        return
+    cache = MembershipCache()
+    if not cache.get_stale_memberships([membership]):
+        return
+
+    version = cache.get_membership_version(membership)
+    token = cache.acquire_rebuild_lock(membership)
+    if not token:
+        # Another worker is rebuilding it
+        return
+    try:
+        build_membership_data(membership, version)
+    finally:
+        cache.release_rebuild_lock(membership, token)
+
+def enqueue_membership_warmup(membership: str) -> None:
+    """Queue a payload rebuild for a membership once the transaction commits"""
+    if frappe.flags.in_install or frappe.flags.in_migrate or frappe.flags.in_patch or frappe.flags.in_import:
+        return
+    # Queued after the version bumps of the same transaction, which run first on commit
+    frappe.db.after_commit.add(partial(enqueue_membership_warmup_job, membership))
+
+def enqueue_membership_warmup_job(membership: str) -> None:
+    """Enqueue the rebuild, at most one pending job per membership version"""
+    # A job already running for an older version must not swallow the warmup of the new one
+    version = MembershipCache().get_membership_version(membership)
+    frappe.enqueue(
+        "personal_trainer_app.api.warm_membership_cache",
+        queue="short",
+        job_id=f"warm_membership_cache:{membership}:{version}",
+        deduplicate=True,
+        membership=membership
+    )
+
+def warm_active_membership_caches() -> None:
+    """Queue rebuilds for active memberships whose payload is missing, outdated or about to expire"""
+    memberships = frappe.get_all("Membership", filters={"active": 1}, pluck="name")
+    for membership in MembershipCache().get_stale_memberships(memberships):
+        enqueue_membership_warmup(membership)
+
 @frappe.whitelist(allow_guest=True)
 def get_micros(fdcid):
     try:
-        food_doc = frappe.get_doc("Food", fdcid)
-        micros = {fact.nutrient: fact.value for fact in food_doc.nutritional_facts if fact.nutrient not in NUTRIENTS}
-        return {"status": "success", "micros": micros}
+        micros = resolve_library_references("Micros", {fdcid})
+        if fdcid not in micros:
+            return {"status": "error", "message": f"Food {fdcid} not found"}
+        return {"status": "success", "micros": micros[fdcid]}
     except Exception as e:
         frappe.log_error(f"Error in get_micros: {str(e)}")
         return {"status": "error", "message": f"An error occurred: {str(e)}"}
 
+@frappe.whitelist(allow_guest=True)
+def get_micros_bulk(fdcids):
+    """Micronutrients of several foods in one request, keyed by fdcid. Unknown foods are left out"""
+    try:
+        if isinstance(fdcids, str):
+            fdcids = frappe.parse_json(fdcids)
+        micros = resolve_library_references("Micros", set(fdcids or []))
+        return {"status": "success", "micros": micros}
+    except Exception as e:
+        frappe.log_error(f"Error in get_micros_bulk: {str(e)}")
+        return {"status": "error", "message": f"An error occurred: {str(e)}"}
+
 @frappe.whitelist(allow_guest=True)
 def get_referrals(client_id):
     try:
@@ -534,7 +1317,14 @@ def get_available_codes(membership):
 
 @frappe.whitelist(allow_guest=True)
 def get_announcement():
-    return frappe.get_single("Website Announcement").as_dict()
+    announcement = frappe.get_cached_doc("Website Announcement")
+    if not is_http_request():
+        return announcement.as_dict()
+
+    etag = make_etag("announcement", announcement.modified)
+    if request_matches_etag(etag):
+        return not_modified_response(etag)
+    return json_response(announcement.as_dict(), etag)
 
 @frappe.whitelist(allow_guest=True)
 def redeem_code(membership, code):
@@ -576,12 +1366,17 @@ def redeem_code(membership, code):
 
 @frappe.whitelist(allow_guest=True)
 def update_client(client_id, is_performance=0, exercise_ref=None, exercise_day=None, **kwargs):
+    from personal_trainer_app.achievements import (
+        COUNTER_FIELDS, record_logged_exercise, record_performance, record_weight
+    )
     client_doc = frappe.get_doc("Client", client_id)
     
     # Check if is_performance is set to 1 and necessary fields are provided
     if int(is_performance) == 1 and exercise_ref and exercise_day:
         # Add a row to the exercise_performance child table
         if "weight" in kwargs and "reps" in kwargs:
+            # Achievements are evaluated against the previous best before the row is added
+            record_performance(client_doc, exercise_ref, float(kwargs["weight"]), int(kwargs["reps"]))
             client_doc.append("exercise_performance", {
                 "exercise": exercise_ref,
                 "weight": float(kwargs["weight"]),
@@ -605,6 +1400,8 @@ def update_client(client_id, is_performance=0, exercise_ref=None, exercise_day=N
                 # Search for the exercise in the specified day table
                 for row in plan_doc.get(day_table, []):
                     if row.exercise == exercise_ref:
+                        if not row.logged and not row.super:
+                            record_logged_exercise(client_doc)
                         row.logged = 1  # Mark as logged
                         break
 
@@ -618,8 +1415,10 @@ def update_client(client_id, is_performance=0, exercise_ref=None, exercise_day=N
                     "weight": float(value),
                     "date": frappe.utils.getdate()
                 })
-            elif hasattr(client_doc, field):
+            elif hasattr(client_doc, field) and field not in COUNTER_FIELDS:
                 setattr(client_doc, field, value)
+        if "weight" in kwargs:
+            record_weight(client_doc)
     
     # Save and commit the updated Client document
     client_doc.save(ignore_permissions=True)
@@ -0,0 +1,83 @@
+"""
+Benchmark of the nutrition part of process_plans_batch: the previous per-food payload path
+(calculate_nutrition_for_amount + calculate_daily_totals for every food of every day) vs one
+NutritionEngine.daily_nutrition pass. Both build the same per-food rows and totals.
+
+    python personal_trainer_app/benchmarks/nutrition_totals.py [plans] [foods]
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from personal_trainer_app.nutrition_engine import MACROS, NutritionEngine
+
+UNITS = {"energy": "kcal", "protein": "g", "carbs": "g", "fat": "g"}
+
+def calculate_nutrition_for_amount(base_nutrition, amount):
+    amount_ratio = amount / 100
+    return {
+        nutrient: {"value": round(facts["value"] * amount_ratio, 1), "unit": facts["unit"]}
+        for nutrient, facts in base_nutrition.items()
+    }
+
+def calculate_daily_totals(foods):
+    totals = {nutrient: {"value": 0, "unit": UNITS[nutrient]} for nutrient in MACROS}
+    for nutrition in foods:
+        if nutrition:
+            for nutrient in MACROS:
+                if nutrient in nutrition:
+                    totals[nutrient]["value"] += nutrition[nutrient]["value"]
+    return {n: {"value": round(t["value"], 1), "unit": t["unit"]} for n, t in totals.items()}
+
+def loop_daily_nutrition(references, days):
+    """The previous api.py path, per food and per day"""
+    results = {}
+    for key, items in days.items():
+        foods = [calculate_nutrition_for_amount(references[food], amount) for food, amount in items]
+        results[key] = (foods, calculate_daily_totals(foods))
+    return results
+
+def engine_daily_nutrition(base_nutrition, days):
+    return NutritionEngine(base_nutrition).daily_nutrition(days, UNITS)
+
+def main(plans=52, foods=40, meals_per_day=6):
+    random.seed(0)
+    base_nutrition = {
+        f"food_{index}": {macro: round(random.uniform(0, 400 if macro == "energy" else 40), 1) for macro in MACROS}
+        for index in range(foods)
+    }
+    references = {
+        food: {macro: {"value": value, "unit": UNITS[macro]} for macro, value in values.items()}
+        for food, values in base_nutrition.items()
+    }
+    days = {
+        (plan, day): [(random.choice(list(base_nutrition)), random.randint(5, 300)) for _ in range(meals_per_day)]
+        for plan in range(plans)
+        for day in range(1, 8)
+    }
+
+    loop = loop_daily_nutrition(references, days)
+    engine = engine_daily_nutrition(base_nutrition, days)
+    diffs = [
+        abs(loop_values[macro]["value"] - engine_values[macro]["value"])
+        for key in days
+        for loop_values, engine_values in zip([*loop[key][0], loop[key][1]], [*engine[key][0], engine[key][1]])
+        for macro in MACROS
+    ]
+
+    runs = 20
+    loop_time = timeit.timeit(lambda: loop_daily_nutrition(references, days), number=runs) / runs
+    engine_time = timeit.timeit(lambda: engine_daily_nutrition(base_nutrition, days), number=runs) / runs
+
+    print(f"{plans} plans, {len(days)} plan-days, {foods} foods")
+    print(f"per-food loops : {loop_time * 1000:8.2f} ms")
+    print(f"engine         : {engine_time * 1000:8.2f} ms")
+    print(f"speedup        : {loop_time / engine_time:8.1f}x")
+    # numpy rounds exact halves to even, Python's round by their decimal value
+    print(f"values off     : {sum(diff > 1e-9 for diff in diffs)} of {len(diffs)}, max {max(diffs):.2f}")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,137 @@
+import frappe
+from frappe.utils import add_days, cint, nowdate
+
+from personal_trainer_app.achievements import update_clients_achievements
+from personal_trainer_app.client_stats import get_clients_to_reconcile, update_clients_statistics
+
+DEFAULT_CLIENT_JOB_LANES = 4
+DEFAULT_CLIENT_JOB_CHUNK_SIZE = 500
+CLIENT_JOB_QUEUES = ("long", "default")
+CLIENT_JOB_MAX_ATTEMPTS = 3
+CLIENT_JOB_CHECKPOINT_TIMEOUT = 86400 * 2
+
+# Daily per-client jobs: how to pick their clients and how to process one chunk
+CLIENT_JOBS = {
+    "statistics": {
+        "clients": get_clients_to_reconcile,
+        "process": update_clients_statistics
+    },
+    "achievements": {
+        "clients": lambda: frappe.get_all("Client", pluck="name", order_by="name asc"),
+        "process": update_clients_achievements
+    }
+}
+
+def get_run_key(job, run_date):
+    return f"client_job:{job}:{run_date}"
+
+def get_chunks_key(job, run_date):
+    return f"{get_run_key(job, run_date)}:chunks"
+
+def get_done_key(job, run_date):
+    return f"{get_run_key(job, run_date)}:done"
+
+def get_attempts_key(job, run_date, index):
+    return f"{get_run_key(job, run_date)}:attempts:{index}"
+
+def get_lane_count(chunk_count):
+    lanes = cint(frappe.db.get_single_value("PT Settings", "client_job_lanes")) or DEFAULT_CLIENT_JOB_LANES
+    return max(1, min(lanes, chunk_count))
+
+def get_run(job, run_date):
+    """Chunks and lane count stored for a run, None when it was never started or has expired"""
+    run = frappe.cache().get_value(get_chunks_key(job, run_date))
+    if isinstance(run, list):
+        # Started before the lane count was stored with the chunks
+        run = {"chunks": run, "lanes": get_lane_count(len(run))}
+    return run
+
+def start_client_job(job, run_date=None):
+    """
+    Split the clients of a daily job into chunks and fan them out over a bounded number of lanes.
+    Chunks and lane count are stored for the run so an interrupted run resumes with the same split.
+    """
+    run_date = run_date or nowdate()
+    if get_run(job, run_date) is not None:
+        return resume_client_job(job, run_date)
+
+    chunk_size = cint(frappe.db.get_single_value("PT Settings", "client_job_chunk_size")) or DEFAULT_CLIENT_JOB_CHUNK_SIZE
+    clients = CLIENT_JOBS[job]["clients"]()
+    chunks = [clients[i:i + chunk_size] for i in range(0, len(clients), chunk_size)]
+    # Lanes pick chunks by index % lanes, a resume must use the same count even if the setting changed
+    run = {"chunks": chunks, "lanes": get_lane_count(len(chunks))}
+    frappe.cache().set_value(get_chunks_key(job, run_date), run, expires_in_sec=CLIENT_JOB_CHECKPOINT_TIMEOUT)
+    enqueue_lanes(job, run_date, run)
+
+def resume_client_job(job, run_date=None):
+    """Re-enqueue the lanes of a run that still has unfinished chunks, running lanes are left alone"""
+    run_date = run_date or nowdate()
+    run = get_run(job, run_date)
+    if not run or not get_pending_chunks(job, run_date, len(run["chunks"])):
+        return
+    enqueue_lanes(job, run_date, run)
+
+def enqueue_lanes(job, run_date, run):
+    if not run["chunks"]:
+        return
+    lanes = run["lanes"]
+    for lane in range(lanes):
+        frappe.enqueue(
+            "personal_trainer_app.client_jobs.run_client_job_lane",
+            queue=CLIENT_JOB_QUEUES[lane % len(CLIENT_JOB_QUEUES)],
+            timeout=3600,
+            job_id=f"{get_run_key(job, run_date)}:lane:{lane}",
+            deduplicate=True,
+            job=job,
+            run_date=run_date,
+            lane=lane,
+            lanes=lanes
+        )
+
+def get_pending_chunks(job, run_date, chunk_count):
+    """Chunks neither done nor out of attempts"""
+    redis = frappe.cache()
+    # Raw pipeline commands so keys are prefixed exactly once
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.smembers(redis.make_key(get_done_key(job, run_date)))
+    pipeline.mget([redis.make_key(get_attempts_key(job, run_date, index)) for index in range(chunk_count)])
+    done, attempts = pipeline.execute() if chunk_count else (set(), [])
+    done = {int(index) for index in done}
+    return [
+        index for index in range(chunk_count)
+        if index not in done and int(attempts[index] or 0) < CLIENT_JOB_MAX_ATTEMPTS
+    ]
+
+def run_client_job_lane(job, run_date, lane, lanes):
+    """Process every pending chunk of this lane, checkpointing each one after its commit"""
+    chunks = (get_run(job, run_date) or {}).get("chunks") or []
+    process = CLIENT_JOBS[job]["process"]
+    redis = frappe.cache()
+    done_key = redis.make_key(get_done_key(job, run_date))
+
+    for index in get_pending_chunks(job, run_date, len(chunks)):
+        if index % lanes != lane:
+            continue
+        attempts_key = redis.make_key(get_attempts_key(job, run_date, index))
+        redis.pipeline(transaction=False).incr(attempts_key).expire(
+            attempts_key, CLIENT_JOB_CHECKPOINT_TIMEOUT
+        ).execute()
+        try:
+            updated = process(chunks[index])
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            frappe.log_error(f"Error in client {job} chunk {index} of {run_date}: {str(e)}")
+            continue
+        redis.pipeline(transaction=False).sadd(done_key, index).expire(
+            done_key, CLIENT_JOB_CHECKPOINT_TIMEOUT
+        ).execute()
+        frappe.log(f"Client {job} chunk {index} of {run_date}: {updated} clients updated")
+
+def resume_client_jobs():
+    """Hourly: pick up chunks of today's and yesterday's runs that failed or were interrupted"""
+    # Yesterday's too, a run interrupted just before midnight is otherwise never resumed
+    today = nowdate()
+    for run_date in (add_days(today, -1), today):
+        for job in CLIENT_JOBS:
+            resume_client_job(job, str(run_date))
@@ -0,0 +1,277 @@
+import frappe
+from frappe.utils import add_days, cint, flt, now_datetime
+
+from personal_trainer_app.api import MembershipCache
+
+STAT_MUSCLES = ["Chest", "Shoulders", "Biceps", "Hamstrings", "Traps", "Triceps", "Lats", "Glutes"]
+MUSCLE_FIELDS = {muscle: f"total_{muscle.lower()}_exercises" for muscle in STAT_MUSCLES}
+COUNTER_FIELDS = ["total_exercises_completed", "total_sets_played", "total_reps_played", *MUSCLE_FIELDS.values()]
+STAT_FIELDS = [*COUNTER_FIELDS, "total_calories_burned"]
+ACTIVITY_FACTOR_FIELDS = {
+    "Sedentary": "activity_factor_sedentary",
+    "Light": "activity_factor_light",
+    "Moderate": "activity_factor_moderate",
+    "Very Active": "activity_factor_very",
+    "Extra Active": "activity_factor_extra"
+}
+GROUP_COLUMNS = {"client": "p.client", "plan": "p.name"}
+STATS_RECONCILE_LOOKBACK_DAYS = 2  # covers a skipped or late nightly run
+
+def get_activity_factors():
+    return {
+        level: frappe.db.get_single_value("PT Settings", field)
+        for level, field in ACTIVITY_FACTOR_FIELDS.items()
+    }
+
+def empty_counters():
+    return dict.fromkeys(COUNTER_FIELDS, 0)
+
+def aggregate_exercise_counters(group_by="client", clients=None, plans=None):
+    """
+    Exercise, set and rep totals and per-muscle exercise counts of completed plans,
+    grouped by client or by plan with two grouped queries over Exercises ⨝ Plan ⨝ Exercise.
+    """
+    group_column = GROUP_COLUMNS[group_by]
+    conditions = ["e.parenttype = 'Plan'", "p.status = 'Completed'"]
+    values = {"muscles": tuple(STAT_MUSCLES)}
+    if clients is not None:
+        if not clients:
+            return {}
+        conditions.append("p.client IN %(clients)s")
+        values["clients"] = tuple(clients)
+    if plans is not None:
+        if not plans:
+            return {}
+        conditions.append("p.name IN %(plans)s")
+        values["plans"] = tuple(plans)
+    where = " AND ".join(conditions)
+
+    totals = frappe.db.sql(f"""
+        SELECT {group_column} AS `key`, COUNT(*) AS exercises,
+            COALESCE(SUM(e.sets), 0) AS sets, COALESCE(SUM(e.reps), 0) AS reps
+        FROM `tabExercises` e
+        JOIN `tabPlan` p ON p.name = e.parent
+        WHERE {where}
+        GROUP BY {group_column}
+    """, values, as_dict=True)
+
+    muscles = frappe.db.sql(f"""
+        SELECT {group_column} AS `key`, x.primary_muscle AS muscle, COUNT(*) AS exercises
+        FROM `tabExercises` e
+        JOIN `tabPlan` p ON p.name = e.parent
+        JOIN `tabExercise` x ON x.name = e.exercise
+        WHERE {where} AND x.primary_muscle IN %(muscles)s
+        GROUP BY {group_column}, x.primary_muscle
+    """, values, as_dict=True)
+
+    counters = {}
+    for row in totals:
+        counters[row.key] = empty_counters()
+        counters[row.key].update({
+            "total_exercises_completed": cint(row.exercises),
+            "total_sets_played": cint(row.sets),
+            "total_reps_played": cint(row.reps)
+        })
+    for row in muscles:
+        counters.setdefault(row.key, empty_counters())[MUSCLE_FIELDS[row.muscle]] = cint(row.exercises)
+    return counters
+
+def get_latest_weights(clients=None):
+    """Latest logged weight of every client (or the given ones) in one query"""
+    condition = "AND parent IN %(clients)s" if clients is not None else ""
+    if clients is not None and not clients:
+        return {}
+    rows = frappe.db.sql(f"""
+        SELECT parent, weight
+        FROM (
+            SELECT parent, weight,
+                ROW_NUMBER() OVER (PARTITION BY parent ORDER BY idx DESC) AS row_num
+            FROM `tabWeight Log`
+            WHERE parenttype = 'Client' AND parentfield = 'weight' {condition}
+        ) ranked
+        WHERE row_num = 1
+    """, {"clients": tuple(clients or ())}, as_dict=True)
+    return {row.parent: row.weight for row in rows}
+
+def get_bmr(client, weight):
+    """Mifflin-St Jeor BMR of a client row, None when age, weight or height are missing or invalid"""
+    try:
+        age = int(client.age) if client.age else None
+        weight = float(weight) if weight else None
+        height = float(client.height) if client.height else None
+    except (ValueError, TypeError):
+        return None
+    if not (weight and height and age is not None):
+        return None
+    return 10 * weight + 6.25 * height - 5 * age + (5 if client.gender == "Male" else -161)
+
+def get_calories_burned(client, weight, total_exercises, activity_factors):
+    """Calories burned for a number of completed exercises, None when it cannot be computed"""
+    bmr = get_bmr(client, weight)
+    factor = activity_factors.get(client.activity_level)
+    if bmr is None or not factor:
+        return None
+    return cint(bmr * flt(factor) * total_exercises)
+
+def get_plan_counters(plan_doc, primary_muscles):
+    """Counters a completed plan contributes to its client, from the rows in memory"""
+    counters = empty_counters()
+    for day in range(1, 8):
+        for row in plan_doc.get(f"d{day}_e") or []:
+            counters["total_exercises_completed"] += 1
+            counters["total_sets_played"] += cint(row.sets)
+            counters["total_reps_played"] += cint(row.reps)
+            muscle = primary_muscles.get(row.exercise)
+            if muscle in MUSCLE_FIELDS:
+                counters[MUSCLE_FIELDS[muscle]] += 1
+    return counters
+
+def get_primary_muscles(plan_docs):
+    exercises = {
+        row.exercise for plan_doc in plan_docs for day in range(1, 8)
+        for row in plan_doc.get(f"d{day}_e") or [] if row.exercise
+    }
+    if not exercises:
+        return {}
+    return dict(frappe.get_all(
+        "Exercise", filters={"name": ["in", list(exercises)]}, fields=["name", "primary_muscle"], as_list=True
+    ))
+
+def apply_plan_statistics(doc, method):
+    """
+    Keep client counters up to date when a plan enters, leaves or changes while Completed.
+    The contribution of the previous version is removed and the one of the new version added.
+    """
+    previous = doc if method == "on_trash" else doc.get_doc_before_save()
+    previous = previous if previous and previous.status == "Completed" else None
+    current = doc if method != "on_trash" and doc.status == "Completed" else None
+    if not previous and not current:
+        return
+
+    primary_muscles = get_primary_muscles([plan_doc for plan_doc in (previous, current) if plan_doc])
+    deltas = {}
+    for plan_doc, sign in ((previous, -1), (current, 1)):
+        if plan_doc and plan_doc.client:
+            delta = deltas.setdefault(plan_doc.client, empty_counters())
+            for field, value in get_plan_counters(plan_doc, primary_muscles).items():
+                delta[field] += sign * value
+
+    apply_counter_deltas(deltas)
+
+def get_eligible_clients(clients):
+    """Clients with the data their BMR needs, the only ones update_clients_statistics writes"""
+    if not clients:
+        return set()
+    client_rows = frappe.get_all(
+        "Client", filters={"name": ["in", clients]}, fields=["name", "age", "height", "gender"]
+    )
+    weights = get_latest_weights(clients)
+    return {client.name for client in client_rows if get_bmr(client, weights.get(client.name)) is not None}
+
+def apply_counter_deltas(deltas):
+    """Add counter deltas to clients with in-place SQL increments, then refresh their calories"""
+    deltas = {
+        client: {field: value for field, value in delta.items() if value}
+        for client, delta in deltas.items()
+    }
+    # Same clients as the reconcile, so both paths agree on every client
+    eligible = get_eligible_clients([client for client, delta in deltas.items() if delta])
+    changed = []
+    for client, delta in deltas.items():
+        if not delta or client not in eligible:
+            continue
+        assignments = ", ".join(f"`{field}` = COALESCE(`{field}`, 0) + %({field})s" for field in delta)
+        frappe.db.sql(
+            f"UPDATE `tabClient` SET {assignments} WHERE name = %(client)s",
+            {**delta, "client": client}
+        )
+        changed.append(client)
+
+    if changed:
+        update_clients_calories(changed)
+        MembershipCache().invalidate_clients_caches(changed)
+
+def update_clients_calories(clients):
+    """Recompute calories burned from the current exercise totals of a few clients"""
+    client_rows = frappe.get_all(
+        "Client",
+        filters={"name": ["in", clients]},
+        fields=["name", "age", "height", "gender", "activity_level",
+                "total_exercises_completed", "total_calories_burned"]
+    )
+    weights = get_latest_weights(clients)
+    activity_factors = get_activity_factors()
+    for client in client_rows:
+        calories = get_calories_burned(
+            client, weights.get(client.name), cint(client.total_exercises_completed), activity_factors
+        )
+        if calories is not None and calories != cint(client.total_calories_burned):
+            frappe.db.set_value("Client", client.name, "total_calories_burned", calories, update_modified=False)
+
+def get_clients_to_reconcile(since=None):
+    """Clients with plans or profiles changed since `since`, by default the last couple of days"""
+    since = since or add_days(now_datetime(), -STATS_RECONCILE_LOOKBACK_DAYS)
+    clients = set(frappe.get_all("Plan", filters={"modified": [">=", since]}, pluck="client", distinct=True))
+    clients.update(frappe.get_all("Client", filters={"modified": [">=", since]}, pluck="name"))
+    clients.discard(None)
+    return sorted(clients)
+
+def reconcile_client_statistics(since=None):
+    """
+    Recompute statistics only for clients with plans or profiles changed since `since`.
+    Counters are kept up to date by apply_plan_statistics, this catches anything it missed.
+    """
+    clients = get_clients_to_reconcile(since)
+    if not clients:
+        return 0
+    return update_clients_statistics(clients)
+
+def write_client_stats(updates):
+    """Bulk write changed statistics and invalidate the memberships of those clients only"""
+    if not updates:
+        return
+    # Derived values, leaving modified alone keeps them out of the next reconcile set
+    frappe.db.bulk_update("Client", updates, update_modified=False)
+    MembershipCache().invalidate_clients_caches(list(updates))
+
+def update_clients_statistics(clients=None):
+    """
+    Recompute lifetime statistics for the given clients (all when None) with set-based queries.
+    Only clients whose values changed are written. Returns the number of updated clients.
+    """
+    client_rows = frappe.get_all(
+        "Client",
+        filters={"name": ["in", clients]} if clients is not None else None,
+        fields=["name", "age", "height", "gender", "activity_level", *STAT_FIELDS]
+    )
+    if not client_rows:
+        return 0
+
+    names = [client.name for client in client_rows] if clients is not None else None
+    counters = aggregate_exercise_counters(clients=names)
+    weights = get_latest_weights(names)
+    activity_factors = get_activity_factors()
+
+    updates = {}
+    skipped = []
+    for client in client_rows:
+        if get_bmr(client, weights.get(client.name)) is None:
+            skipped.append(client.name)
+            continue
+
+        stats = counters.get(client.name) or empty_counters()
+        calories = get_calories_burned(
+            client, weights.get(client.name), stats["total_exercises_completed"], activity_factors
+        )
+        if calories is not None:
+            stats["total_calories_burned"] = calories
+
+        changed = {field: value for field, value in stats.items() if cint(client.get(field)) != value}
+        if changed:
+            updates[client.name] = changed
+
+    if skipped:
+        frappe.log_error(f"Missing data for BMR calculation for clients: {', '.join(skipped)}")
+
+    write_client_stats(updates)
+    return len(updates)
@@ -1,6 +1,8 @@
 # personal_trainer_app/personal_trainer_app/config/nutrition.py
 
 from __future__ import unicode_literals
+import functools
+import re
 import frappe
 
 NUTRIENT_MAPPING = {
@@ -35,6 +37,14 @@ NUTRIENT_MAPPING = {
     ]
 }
 
+# Materialized per 100 g macro columns on Food
+MACRO_COLUMNS = {
+    'energy': 'energy_100g',
+    'protein': 'protein_100g',
+    'carbs': 'carbs_100g',
+    'fat': 'fat_100g'
+}
+
 # Function to get nutrient mappings with possibility to override from Custom Settings
 def get_nutrient_mappings():
     """
@@ -42,4 +52,56 @@ def get_nutrient_mappings():
     Returns:
         dict: Nutrient name mappings
     """
-    return NUTRIENT_MAPPING
\ No newline at end of file
+    return NUTRIENT_MAPPING
+
+class NutrientResolver:
+    """
+    Maps nutrient names to macros with an exact-match table and one compiled regex for fuzzy names.
+    Exact matches rank by their position in the mapping and always beat fuzzy matches.
+    """
+
+    def __init__(self, mappings):
+        self.exact = {}
+        for macro, variations in mappings.items():
+            for rank, variation in enumerate(variations):
+                self.exact.setdefault(variation, (macro, rank))
+
+        self.fuzzy_rank_offset = max(len(variations) for variations in mappings.values())
+        # Longest variations first, whole words only so 'Fat' does not match 'Fatty acids'
+        alternatives = sorted(self.exact, key=len, reverse=True)
+        self.pattern = re.compile(
+            r"(?<![A-Za-z])(?:" + "|".join(re.escape(variation) for variation in alternatives) + r")(?![A-Za-z])"
+        )
+        self.resolve = functools.lru_cache(maxsize=4096)(self._resolve)
+
+    def _resolve(self, nutrient):
+        """(macro, rank) for a nutrient name, or None"""
+        if nutrient in self.exact:
+            return self.exact[nutrient]
+        match = self.pattern.search(nutrient)
+        if match:
+            macro, rank = self.exact[match.group(0)]
+            return macro, self.fuzzy_rank_offset + rank
+        return None
+
+    def resolve_facts(self, facts):
+        """Best ranked fact for each macro, the first one wins ties"""
+        best = {}
+        for fact in facts:
+            resolved = self.resolve(fact.nutrient) if fact.nutrient else None
+            if resolved:
+                macro, rank = resolved
+                if macro not in best or rank < best[macro][0]:
+                    best[macro] = (rank, fact)
+        return {macro: fact for macro, (rank, fact) in best.items()}
+
+_default_resolver = None
+
+def get_nutrient_resolver(mappings=None):
+    """Shared resolver for the configured mappings, compiled once per process"""
+    global _default_resolver
+    if mappings is not None and mappings is not get_nutrient_mappings():
+        return NutrientResolver(mappings)
+    if _default_resolver is None:
+        _default_resolver = NutrientResolver(get_nutrient_mappings())
+    return _default_resolver
@@ -0,0 +1,146 @@
+import csv
+
+import frappe
+from frappe import _
+from frappe.utils import now
+
+from personal_trainer_app.api import MembershipCache
+
+IMPORT_CHUNK_SIZE = 200
+
+# CSV column -> Exercise field
+EXERCISE_COLUMNS = {
+    "Category": "category",
+    "Equipment": "equipment",
+    "Starting": "starting",
+    "Ending": "ending",
+    "Instructions": "instructions",
+    "Force": "force",
+    "Level": "level",
+    "Mechanic": "mechanic",
+    "Thumbnail": "thumbnail",
+    "Video": "video",
+    "PrimaryMuscle": "primary_muscle"
+}
+SECONDARY_MUSCLE_COLUMN = "Muscle (Secondary Muscles)"
+
+def get_premade_exercises_path():
+    return frappe.get_app_path("personal_trainer_app", "public", "records", "exercises.csv")
+
+def iter_exercises(file):
+    """
+    Stream (exercise name, fields, secondary muscles) from the exercises CSV.
+    Rows without an exercise continue the previous one with another secondary muscle.
+    """
+    current = None
+    for row in csv.DictReader(file):
+        muscle = (row.get(SECONDARY_MUSCLE_COLUMN) or "").strip()
+        if row.get("Exercise"):
+            if current:
+                yield current
+            fields = {field: row.get(column) for column, field in EXERCISE_COLUMNS.items()}
+            current = (row["Exercise"], fields, [muscle] if muscle else [])
+        elif current and muscle and muscle not in current[2]:
+            current[2].append(muscle)
+    if current:
+        yield current
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def write_exercises_chunk(chunk, existing):
+    """Bulk insert new exercises, bulk update existing ones and replace their secondary muscles"""
+    timestamp = now()
+    user = frappe.session.user
+    new_rows = []
+    updates = {}
+    for name, fields, _muscles in chunk:
+        if name in existing:
+            updates[name] = fields
+        else:
+            new_rows.append((name, name, *fields.values(), 1, timestamp, timestamp, user, user, 0))
+            existing.add(name)
+
+    if new_rows:
+        frappe.db.bulk_insert(
+            "Exercise",
+            ["name", "exercise", *EXERCISE_COLUMNS.values(), "enabled",
+             "creation", "modified", "owner", "modified_by", "docstatus"],
+            new_rows
+        )
+    if updates:
+        frappe.db.bulk_update("Exercise", updates, modified=timestamp, modified_by=user)
+
+    names = [name for name, _fields, _muscles in chunk]
+    frappe.db.delete("Muscles", {"parenttype": "Exercise", "parent": ["in", names]})
+    muscle_rows = [
+        (frappe.generate_hash(length=10), name, "Exercise", "secondary_muscles", idx, muscle,
+         timestamp, timestamp, user, user, 0)
+        for name, _fields, muscles in chunk
+        for idx, muscle in enumerate(muscles, start=1)
+    ]
+    if muscle_rows:
+        frappe.db.bulk_insert(
+            "Muscles",
+            ["name", "parent", "parenttype", "parentfield", "idx", "muscle",
+             "creation", "modified", "owner", "modified_by", "docstatus"],
+            muscle_rows
+        )
+
+    return list(updates)
+
+def import_exercises(file_path=None, user=None):
+    """
+    Background job upserting the premade exercises in chunks, streaming the CSV.
+    Progress is published to the user who started the import.
+    """
+    file_path = file_path or get_premade_exercises_path()
+    with open(file_path, newline="") as f:
+        total = sum(1 for _exercise in iter_exercises(f))
+
+    existing = set(frappe.get_all("Exercise", pluck="name"))
+    cache = MembershipCache()
+    title = _("Importing exercises")
+    count = 0
+
+    with open(file_path, newline="") as f:
+        for chunk in chunked(iter_exercises(f), IMPORT_CHUNK_SIZE):
+            updated = write_exercises_chunk(chunk, existing)
+
+            # Run when the chunk commits
+            cache.invalidate_library_items("Exercise", [name for name, _fields, _muscles in chunk])
+            for name in updated:
+                cache.invalidate_library_dependents("Exercise", name)
+            frappe.db.commit()
+
+            count += len(chunk)
+            # publish_progress has no user, send the same event to the importing user only
+            frappe.publish_realtime("progress", {
+                "percent": count * 100 / max(total, 1),
+                "title": title,
+                "description": _("{0} exercises imported").format(count)
+            }, user=user)
+
+    frappe.db.set_single_value("PT Settings", "fetched", 1)
+    frappe.db.commit()
+    frappe.publish_realtime("exercise_import_complete", {"count": count}, user=user)
+    return count
+
+def enqueue_exercise_import():
+    """Queue the premade exercise import, at most one pending import per site"""
+    frappe.enqueue(
+        "personal_trainer_app.exercise_import.import_exercises",
+        queue="long",
+        timeout=1800,
+        job_id="import_premade_exercises",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        user=frappe.session.user
+    )
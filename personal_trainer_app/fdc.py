@@ -0,0 +1,274 @@
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+FDC_BASE_URL = "https://api.nal.usda.gov/fdc/v1"
+UNSPLASH_SEARCH_URL = "https://api.unsplash.com/search/photos"
+FDC_BATCH_SIZE = 20  # The multi-food endpoint accepts at most 20 ids per request
+FDC_MAX_WORKERS = 4
+FDC_TIMEOUT = 30
+
+def get_fdc_base_url():
+    """FDC API root, `fdc_base_url` in site_config points imports at a local stub"""
+    return (frappe.conf.get("fdc_base_url") or FDC_BASE_URL).rstrip("/")
+
+def get_fdc_cache_dir():
+    """On-disk cache of raw FDC responses, shared by every import of the site"""
+    return frappe.get_site_path("private", "fdc_cache")
+
+def make_session(pool_size=FDC_MAX_WORKERS):
+    """Pooled HTTP session with retries on rate limiting and transient server errors"""
+    retry = Retry(
+        total=3,
+        backoff_factor=1,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"})
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class FDCResponseCache:
+    """
+    Content-addressed store of raw FDC food responses.
+    Bodies live under objects/<sha256>.json, refs/<fdcid> holds the digest of the latest body of a food.
+    Safe to use from worker threads, it never touches frappe.local.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.refs_dir = os.path.join(root, "refs")
+
+    def get(self, fdcid):
+        try:
+            with open(os.path.join(self.refs_dir, str(fdcid))) as f:
+                digest = f.read().strip()
+            with open(os.path.join(self.objects_dir, f"{digest}.json"), "rb") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def set(self, fdcid, data):
+        body = json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+        digest = hashlib.sha256(body).hexdigest()
+        self._write(os.path.join(self.objects_dir, f"{digest}.json"), body)
+        self._write(os.path.join(self.refs_dir, str(fdcid)), digest.encode())
+
+    def _write(self, path, content):
+        """Write through a temporary file so readers never see a partial body"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+def fetch_fdc_batch(session, base_url, api_key, fdcids):
+    """Fetch up to FDC_BATCH_SIZE foods with one call to the multi-food endpoint"""
+    response = session.post(
+        f"{base_url}/foods",
+        params={"api_key": api_key},
+        json={"fdcIds": [int(fdcid) for fdcid in fdcids], "format": "full"},
+        timeout=FDC_TIMEOUT
+    )
+    response.raise_for_status()
+    return {str(food["fdcId"]): food for food in response.json() if "fdcId" in food}
+
+def fetch_fdc_foods(fdcids, api_key, session=None, max_workers=FDC_MAX_WORKERS):
+    """
+    Fetch raw FDC data of many foods, keyed by fdcid.
+    Cached responses are served from disk, the rest is fetched in batches with bounded concurrency.
+    Returns (foods, errors) where errors maps failed fdcids to the error message.
+    """
+    cache = FDCResponseCache(get_fdc_cache_dir())
+    foods = {}
+    missing = []
+    for fdcid in dict.fromkeys(str(fdcid) for fdcid in fdcids):
+        data = cache.get(fdcid)
+        if data is not None:
+            foods[fdcid] = data
+        else:
+            missing.append(fdcid)
+
+    errors = {}
+    if not missing:
+        return foods, errors
+
+    if not api_key:
+        frappe.throw("API key for FDC is missing. Please configure it in the PT Settings.")
+
+    base_url = get_fdc_base_url()
+    own_session = session is None
+    session = session or make_session(max_workers)
+    batches = [missing[i:i + FDC_BATCH_SIZE] for i in range(0, len(missing), FDC_BATCH_SIZE)]
+
+    def fetch(batch):
+        try:
+            fetched = fetch_fdc_batch(session, base_url, api_key, batch)
+        except Exception as e:
+            return batch, {}, str(e)
+        for fdcid, data in fetched.items():
+            cache.set(fdcid, data)
+        return batch, fetched, None
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for batch, fetched, error in executor.map(fetch, batches):
+                foods.update(fetched)
+                for fdcid in batch:
+                    if fdcid not in fetched:
+                        errors[fdcid] = error or "Not returned by FDC"
+    finally:
+        if own_session:
+            session.close()
+
+    return foods, errors
+
+def fetch_unsplash_image(session, title, unsplash_api):
+    """First Unsplash search result for a food title, None when nothing was found"""
+    response = session.get(
+        UNSPLASH_SEARCH_URL,
+        params={"query": title, "client_id": unsplash_api},
+        timeout=FDC_TIMEOUT
+    )
+    response.raise_for_status()
+    results = response.json().get("results")
+    return results[0]["urls"]["small"] if results else None
+
+def fetch_unsplash_images(titles, unsplash_api, session, max_workers=FDC_MAX_WORKERS):
+    """Images for several food titles over the pooled session, keyed by title"""
+    def fetch(title):
+        try:
+            return title, fetch_unsplash_image(session, title, unsplash_api), None
+        except Exception as e:
+            return title, None, str(e)
+
+    images = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for title, image, error in executor.map(fetch, list(dict.fromkeys(titles))):
+            if error:
+                frappe.log_error(f"Image fetch error: {error}", "Unsplash Error")
+            elif image:
+                images[title] = image
+    return images
+
+def apply_fdc_data(food_doc, data):
+    """Set the basic fields and nutritional facts of a Food from a raw FDC response"""
+    if "fdcId" not in data:
+        frappe.throw("Invalid API response: Missing fdcId")
+
+    food_doc.title = data["description"].split(",")[0].strip()
+    food_doc.description = data.get("description", "")
+    if "foodCategory" in data and "description" in data["foodCategory"]:
+        food_doc.category = data["foodCategory"]["description"]
+
+    # Clear and update nutritional facts
+    food_doc.nutritional_facts = []
+    for nutrient in data.get("foodNutrients", []):
+        # Skip nutrient labels and categories
+        if (nutrient.get("type") == "FoodNutrient" and
+            "amount" in nutrient and
+            "nutrient" in nutrient and
+            "name" in nutrient["nutrient"] and
+            "unitName" in nutrient["nutrient"] and
+            not nutrient["nutrient"].get("isNutrientLabel", False)):
+
+            food_doc.append("nutritional_facts", {
+                "nutrient": nutrient["nutrient"]["name"][:140],  # Truncate to avoid field length issues
+                "value": nutrient["amount"],
+                "unit": nutrient["nutrient"]["unitName"]
+            })
+
+def import_foods(rows):
+    """
+    Import foods from (fdcid, image) rows: new foods are fetched from FDC in batches,
+    existing foods only get their image updated. Everything is written in a single transaction.
+    Returns the number of imported or updated foods.
+    """
+    settings = frappe.get_cached_doc("PT Settings")
+    rows = {str(row["fdcid"]).strip(): row.get("image") for row in rows if row.get("fdcid")}
+    existing = {
+        food.fdcid: food for food in frappe.get_all(
+            "Food", filters={"fdcid": ["in", list(rows)]}, fields=["name", "fdcid", "image"]
+        )
+    } if rows else {}
+    new_fdcids = [fdcid for fdcid in rows if fdcid not in existing]
+
+    session = make_session()
+    try:
+        foods, errors = fetch_fdc_foods(new_fdcids, settings.fdc_api, session=session)
+        if errors:
+            details = ", ".join(f"{fdcid}: {error}" for fdcid, error in errors.items())
+            frappe.log_error(f"Failed to retrieve food data: {details}", "API Error")
+            frappe.throw(f"Failed to retrieve food data for {len(errors)} foods: {details}")
+
+        new_docs = []
+        for fdcid in new_fdcids:
+            food_doc = frappe.new_doc("Food")
+            food_doc.fdcid = fdcid
+            food_doc.image = rows[fdcid]
+            apply_fdc_data(food_doc, foods[fdcid])
+            food_doc.flags.fdc_data_applied = True
+            new_docs.append(food_doc)
+
+        if settings.auto_image and settings.unsplash_api:
+            missing_images = [food_doc for food_doc in new_docs if not food_doc.image]
+            images = fetch_unsplash_images(
+                [food_doc.title for food_doc in missing_images], settings.unsplash_api, session
+            )
+            for food_doc in missing_images:
+                food_doc.image = images.get(food_doc.title)
+    finally:
+        session.close()
+
+    try:
+        for food_doc in new_docs:
+            food_doc.insert()
+
+        for fdcid, food in existing.items():
+            if rows[fdcid] and rows[fdcid] != food.image:
+                food_doc = frappe.get_doc("Food", food.name)
+                food_doc.image = rows[fdcid]
+                food_doc.save()
+
+        frappe.db.commit()
+    except Exception:
+        frappe.db.rollback()
+        raise
+
+    return len(rows)
+
+def get_premade_foods_path():
+    return frappe.get_app_path("personal_trainer_app", "public", "records", "foods.csv")
+
+def import_premade_foods(file_path=None, user=None):
+    """Background job importing the premade foods, the result is sent to the user who started it"""
+    file_path = file_path or get_premade_foods_path()
+    with open(file_path, newline="") as f:
+        count = import_foods(csv.DictReader(f))
+
+    frappe.db.set_single_value("PT Settings", "food_fetched", 1)
+    frappe.db.commit()
+    frappe.publish_realtime("food_import_complete", {"count": count}, user=user)
+    return count
+
+def enqueue_food_import():
+    """Queue the premade food import, at most one pending import per site"""
+    frappe.enqueue(
+        "personal_trainer_app.fdc.import_premade_foods",
+        queue="long",
+        timeout=1800,
+        job_id="import_premade_foods",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        user=frappe.session.user
+    )
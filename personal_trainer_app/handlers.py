@@ -1,37 +1,50 @@
-from .api import MembershipCache
+from .api import MembershipCache, enqueue_membership_warmup
+from .client_stats import apply_plan_statistics
 import frappe
 
 def on_plan_update(doc, method):
     """Handle plan updates"""
     cache = MembershipCache()
-    frappe.cache().delete_value(cache.get_version_hash_key(doc.membership))
     cache.invalidate_membership_cache(doc.membership)
+    # on_update already ran for inserts
+    if method != "after_insert":
+        cache.update_library_dependents(doc, removed=method == "on_trash")
+        apply_plan_statistics(doc, method)
+    enqueue_membership_warmup(doc.membership)
 
 def on_membership_update(doc, method):
     """Handle membership updates"""
     cache = MembershipCache()
-    frappe.cache().delete_value(cache.get_version_hash_key(doc.name))
     cache.invalidate_membership_cache(doc.name)
+    if method != "on_trash" and doc.active:
+        enqueue_membership_warmup(doc.name)
 
 def on_client_update(doc, method):
     """Handle client updates"""
     cache = MembershipCache()
-    # Invalidate version hash for all client's memberships
-    for membership in frappe.get_all("Membership", filters={"client": doc.name}):
-        frappe.cache().delete_value(cache.get_version_hash_key(membership.name))
     cache.invalidate_client_caches(doc.name)
 
 def on_exercise_update(doc, method):
     """Handle exercise library updates"""
     cache = MembershipCache()
-    if cache.get_cached_library_item("Exercise", doc.name):
-        frappe.cache().delete_value(cache.get_library_cache_key("Exercise", doc.name))
+    cache.invalidate_library_item("Exercise", doc.name)
+    cache.invalidate_library_dependents("Exercise", doc.name)
 
 def on_food_update(doc, method):
     """Handle food library updates"""
     cache = MembershipCache()
-    if cache.get_cached_library_item("Food", doc.name):
-        frappe.cache().delete_value(cache.get_library_cache_key("Food", doc.name))
+    cache.invalidate_library_item("Food", doc.name)
+    cache.invalidate_library_item("Micros", doc.name)
+    cache.invalidate_library_dependents("Food", doc.name)
+
+# PT Settings fields the membership payload is built from
+PAYLOAD_SETTINGS = ("membership_completed_plans", "shared_library_snapshot", "performance_history_limit")
+
+def on_settings_update(doc, method):
+    """Rebuild every membership payload when a setting it is built from changes"""
+    if any(doc.has_value_changed(field) for field in PAYLOAD_SETTINGS):
+        cache = MembershipCache()
+        cache.invalidate_membership_caches(frappe.get_all("Membership", pluck="name"))
 
 def on_chat_update(doc, method):
     """Handle chat updates"""
@@ -168,6 +168,9 @@ doc_events = {
     "Food": {
         "on_update": "personal_trainer_app.handlers.on_food_update"
     },
+    "PT Settings": {
+        "on_update": "personal_trainer_app.handlers.on_settings_update"
+    },
     "Chat": {
         "on_update": "personal_trainer_app.handlers.on_chat_update",
         "after_insert": "personal_trainer_app.handlers.on_chat_update"
@@ -182,13 +185,12 @@ scheduler_events = {
 # 		"personal_trainer_app.tasks.all"
 # 	],
 	"daily": [
-        "personal_trainer_app.personal_trainer.doctype.promo_code.promo_code.update_promo_code_statuses",
 		"personal_trainer_app.tasks.update_all_client_statistics",
         "personal_trainer_app.tasks.update_all_client_achievements",
-        "personal_trainer_app.personal_trainer.doctype.plan.plan.update_plan_statuses",
 	],
 	"hourly": [
-		"personal_trainer_app.personal_trainer.doctype.membership.membership.update_membership_statuses"
+		"personal_trainer_app.transitions.run_due_transitions",
+		"personal_trainer_app.client_jobs.resume_client_jobs"
 	],
 # 	"weekly": [
 # 		"personal_trainer_app.tasks.weekly"
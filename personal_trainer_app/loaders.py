@@ -0,0 +1,47 @@
+import frappe
+
+PLAN_DAYS = range(1, 8)
+PLAN_CHILD_TABLES = {
+    "Exercises": tuple(f"d{day}_e" for day in PLAN_DAYS),
+    "Foods": tuple(f"d{day}_f" for day in PLAN_DAYS)
+}
+
+def load_plans(filters=None, fields=None, order_by=None, limit=None, child_doctypes=("Exercises", "Foods")):
+    """
+    Load plans as lightweight rows with their day tables attached.
+    Uses one query for the plans and one per child doctype, regardless of the number of plans.
+    """
+    query = {"filters": filters, "fields": fields or ["*"]}
+    if order_by:
+        query["order_by"] = order_by
+    if limit:
+        query["limit"] = limit
+
+    plans = frappe.get_all("Plan", **query)
+    attach_plan_children(plans, child_doctypes)
+    return plans
+
+def attach_plan_children(plans, child_doctypes=("Exercises", "Foods")):
+    """Attach d{n}_e / d{n}_f rows to already loaded plan rows, grouped by parent and parentfield"""
+    for plan in plans:
+        for doctype in child_doctypes:
+            for table in PLAN_CHILD_TABLES[doctype]:
+                plan[table] = []
+
+    if not plans:
+        return plans
+
+    plans_by_name = {plan.name: plan for plan in plans}
+    for doctype in child_doctypes:
+        rows = frappe.get_all(
+            doctype,
+            filters={"parenttype": "Plan", "parent": ["in", list(plans_by_name)]},
+            fields=["*"],
+            order_by="parent asc, parentfield asc, idx asc"
+        )
+        for row in rows:
+            plan = plans_by_name.get(row.parent)
+            if plan is not None and row.parentfield in plan:
+                plan[row.parentfield].append(row)
+
+    return plans
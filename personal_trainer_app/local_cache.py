@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import frappe
+
+LIBRARY_INVALIDATION_CHANNEL = "personal_trainer_app:library_invalidation"
+
+class LRUCache:
+    """Bounded, TTL-aware and thread-safe in-process LRU cache"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+# Exercise and food library, shared by all sites served by this worker (keys carry the site prefix)
+library_cache = LRUCache(maxsize=10000, ttl=600)
+
+_listener_lock = threading.Lock()
+_listener_started = False
+
+def ensure_invalidation_listener() -> None:
+    """Start the pub/sub listener that evicts library entries invalidated by any worker, once per process"""
+    global _listener_started
+    if _listener_started:
+        return
+
+    with _listener_lock:
+        if _listener_started:
+            return
+        thread = threading.Thread(
+            target=_listen_for_invalidations,
+            args=(frappe.cache(),),
+            name="library-cache-invalidation",
+            daemon=True
+        )
+        thread.start()
+        _listener_started = True
+
+def _listen_for_invalidations(redis) -> None:
+    while True:
+        try:
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(LIBRARY_INVALIDATION_CHANNEL)
+            for message in pubsub.listen():
+                for key in json.loads(message["data"]):
+                    library_cache.delete(key)
+        except Exception:
+            # Messages may have been missed while disconnected, start over from Redis
+            library_cache.clear()
+            time.sleep(5)
+
+def publish_library_invalidation(keys) -> None:
+    """Evict library entries here and in every other worker"""
+    keys = list(keys)
+    for key in keys:
+        library_cache.delete(key)
+    try:
+        frappe.cache().publish(LIBRARY_INVALIDATION_CHANNEL, json.dumps(keys))
+    except Exception as e:
+        frappe.log_error(f"Error publishing library invalidation: {str(e)}")
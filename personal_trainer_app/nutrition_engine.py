@@ -0,0 +1,108 @@
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MACROS = ("energy", "protein", "carbs", "fat")
+
+class NutritionEngine:
+    """
+    Per-food macro values and daily totals for many plan-days at once.
+    Holds a foods x macros matrix (per 100 g); the values of all foods eaten are one vectorized
+    amounts x macros product, rounded and summed per plan-day with numpy.
+    """
+
+    def __init__(self, base_nutrition: Dict[str, Dict[str, float]]):
+        """base_nutrition maps each food to its macro values per 100 g, missing macros count as 0"""
+        self.food_index = {food: index for index, food in enumerate(base_nutrition)}
+        self.macros = np.zeros((len(self.food_index), len(MACROS)))
+        for food, values in base_nutrition.items():
+            row = self.food_index[food]
+            for column, macro in enumerate(MACROS):
+                self.macros[row, column] = float(values.get(macro) or 0)
+
+    def item_values(
+        self,
+        days: Dict[Hashable, Sequence[Tuple[str, float]]],
+        precision: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Plan-day row and macro values of every food eaten, foods without nutrition data are skipped.
+        With `precision`, every value is rounded like the per-food values of the payload.
+        """
+        rows, foods, amounts = [], [], []
+        for row, items in enumerate(days.values()):
+            for food, amount in items:
+                column = self.food_index.get(food)
+                if column is not None:
+                    rows.append(row)
+                    foods.append(column)
+                    amounts.append(amount)
+        values = self.macros[foods] * (np.array(amounts, dtype=float) / 100).reshape(-1, 1)
+        if precision is not None:
+            values = round_values(values, precision)
+        return np.array(rows, dtype=int), values
+
+    def sum_days(self, count: int, rows: np.ndarray, values: np.ndarray) -> np.ndarray:
+        totals = np.zeros((count, len(MACROS)))
+        np.add.at(totals, rows, values)
+        return totals
+
+    def daily_totals(self, days: Dict[Hashable, Sequence[Tuple[str, float]]]) -> Dict[Hashable, Dict[str, float]]:
+        """Unrounded macro totals for each plan-day, given (food, grams) pairs per plan-day"""
+        if not days:
+            return {}
+        rows, values = self.item_values(days)
+        totals = self.sum_days(len(days), rows, values)
+        return {key: dict(zip(MACROS, row)) for key, row in zip(days, totals.tolist())}
+
+    def daily_nutrition(
+        self,
+        days: Dict[Hashable, Sequence[Tuple[str, float]]],
+        units: Dict[str, str],
+        precision: int = 1
+    ) -> Dict[Hashable, Tuple[List[Optional[Dict]], Dict[str, Dict]]]:
+        """
+        Per-food nutrition and totals of each plan-day in the {'value', 'unit'} shape of the membership
+        payload, from a single pass. Every food is rounded to `precision` and every total is the sum of
+        its rounded foods, so a total is always the sum of what is shown. Foods without nutrition get None.
+        """
+        if not days:
+            return {}
+        rows, values = self.item_values(days, precision)
+        totals = np.round(self.sum_days(len(days), rows, values), precision)
+
+        item_rows = iter(values.tolist())
+        nutrition = {}
+        for (key, items), total in zip(days.items(), totals.tolist()):
+            foods = [
+                {macro: {'value': value, 'unit': units[macro]} for macro, value in zip(MACROS, next(item_rows))}
+                if food in self.food_index else None
+                for food, _ in items
+            ]
+            totals_row = {macro: {'value': value, 'unit': units[macro]} for macro, value in zip(MACROS, total)}
+            nutrition[key] = (foods, totals_row)
+        return nutrition
+
+def round_values(values: np.ndarray, precision: int) -> np.ndarray:
+    """
+    np.round, except for values within float noise of a half: numpy rounds the scaled value half to even,
+    Python's round the exact decimal, and the payload has always used Python's round.
+    """
+    rounded = np.round(values, precision)
+    scaled = values * 10 ** precision
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [round(value, precision) for value in values[near_half].tolist()]
+    return rounded
+
+def base_nutrition_from_references(food_references: Dict[str, Dict]) -> Dict[str, Dict[str, float]]:
+    """Macro values per 100 g from processed food references, foods without nutrition facts are left out"""
+    return {
+        food: {macro: fact['value'] for macro, fact in reference['nutrition_per_100g'].items()}
+        for food, reference in food_references.items()
+        if reference.get('nutrition_per_100g')
+    }
+
+def daily_items(plan_doc, day: int) -> List[Tuple[str, float]]:
+    """(food, grams) pairs of a plan day"""
+    return [(food.food, float(food.amount)) for food in plan_doc.get(f"d{day}_f", [])]
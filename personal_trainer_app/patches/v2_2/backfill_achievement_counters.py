@@ -0,0 +1,26 @@
+import frappe
+
+
+def execute():
+    """Seed the running achievement counters of existing clients from their plans and logs"""
+    frappe.db.sql("""
+        UPDATE `tabClient` c
+        LEFT JOIN (
+            SELECT p.client, COUNT(*) AS logged
+            FROM `tabExercises` e
+            JOIN `tabPlan` p ON p.name = e.parent
+            WHERE e.parenttype = 'Plan' AND e.logged = 1 AND e.super = 0
+            GROUP BY p.client
+        ) l ON l.client = c.name
+        LEFT JOIN (
+            SELECT parent,
+                SUM(HOUR(creation) >= 5 AND HOUR(creation) < 10) AS early,
+                SUM(HOUR(creation) >= 18) AS late
+            FROM `tabPerformance Log`
+            WHERE parenttype = 'Client' AND parentfield = 'exercise_performance'
+            GROUP BY parent
+        ) w ON w.parent = c.name
+        SET c.logged_exercises_count = COALESCE(l.logged, 0),
+            c.early_workouts_count = COALESCE(w.early, 0),
+            c.late_workouts_count = COALESCE(w.late, 0)
+    """)
@@ -0,0 +1,14 @@
+import frappe
+from personal_trainer_app.api import group_child_rows, resolve_food_macros
+
+
+def execute():
+    """Resolve the materialized per 100 g macro columns of existing foods"""
+    foods = frappe.get_all("Food", pluck="name")
+    if not foods:
+        return
+
+    facts = group_child_rows("Nutritional Facts", "Food", None, ["nutrient", "value", "unit"])
+    for name in foods:
+        food = frappe._dict(name=name, nutritional_facts=facts.get(name, []))
+        frappe.db.set_value("Food", name, resolve_food_macros(food), update_modified=False)
@@ -0,0 +1,6 @@
+from personal_trainer_app.api import MembershipCache
+
+
+def execute():
+    """Index the exercises and foods of existing plans, so library edits reach the memberships using them"""
+    MembershipCache().rebuild_library_dependents()
@@ -0,0 +1,19 @@
+import frappe
+from frappe.utils import now_datetime
+
+
+def execute():
+    """Mark every record that can still change status as due, the next transitions run sets the real time"""
+    now = now_datetime()
+    frappe.db.sql("""
+        UPDATE `tabPlan` SET next_transition_at = %s
+        WHERE status != 'Completed' AND `start` IS NOT NULL AND `end` IS NOT NULL
+    """, now)
+    frappe.db.sql("""
+        UPDATE `tabMembership` SET next_transition_at = %s
+        WHERE `start` IS NOT NULL AND `end` IS NOT NULL AND (active = 1 OR `start` > %s)
+    """, (now, now))
+    frappe.db.sql("""
+        UPDATE `tabPromo Code` SET next_transition_at = %s
+        WHERE manual = 0 AND `start` IS NOT NULL AND `end` IS NOT NULL
+    """, now)
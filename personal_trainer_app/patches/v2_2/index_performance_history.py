@@ -0,0 +1,6 @@
+import frappe
+
+
+def execute():
+    """Add the index behind the per-client performance history to existing sites"""
+    frappe.db.add_index("Performance Log", ["parent", "exercise", "creation"])
@@ -1,8 +1,23 @@
 # Copyright (c) 2024, YZ and Contributors
 # See license.txt
 
-# import frappe
+from unittest.mock import patch
+
+import frappe
 from frappe.tests import IntegrationTestCase, UnitTestCase
+from frappe.utils import add_days, get_datetime, now_datetime, nowdate
+
+from personal_trainer_app.achievements import (
+	STRESS_BUSTER_LOGS, record_logged_exercise, record_performance, record_weight, update_clients_achievements
+)
+from personal_trainer_app.client_jobs import (
+	CLIENT_JOB_MAX_ATTEMPTS, get_attempts_key, get_chunks_key, get_done_key, get_pending_chunks,
+	resume_client_job, resume_client_jobs, run_client_job_lane, start_client_job
+)
+from personal_trainer_app.client_stats import (
+	COUNTER_FIELDS, aggregate_exercise_counters, empty_counters, reconcile_client_statistics
+)
+from personal_trainer_app.tests.utils import make_client, make_exercise, make_membership, make_plan, set_settings
 
 
 # On IntegrationTestCase, the doctype test records and all
@@ -12,7 +27,7 @@ EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 
 
-class TestClient(UnitTestCase):
+class UnitTestClient(UnitTestCase):
 	"""
 	Unit tests for Client.
 	Use this class for testing individual functions and methods.
@@ -27,4 +42,241 @@ class TestClient(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
\ No newline at end of file
+	def setUp(self):
+		self.client = make_client(with_bmr=True)
+		# Started weeks ago, so the first plans are already completed when inserted
+		self.membership = make_membership(self.client.name, start=add_days(now_datetime(), -60))
+		self.bench = make_exercise("Test Stats Bench Press", "Chest").name
+		self.curl = make_exercise("Test Stats Curl", "Biceps").name
+
+	def get_counters(self):
+		return frappe.db.get_value("Client", self.client.name, COUNTER_FIELDS, as_dict=True)
+
+	def assertCounters(self, **expected):
+		counters = empty_counters()
+		counters.update(expected)
+		self.assertEqual(dict(self.get_counters()), counters)
+
+	def test_completed_plan_adds_counters(self):
+		plan = make_plan(self.client.name, self.membership.name, exercises=[self.bench, self.curl])
+		self.assertEqual(plan.status, "Completed")
+		self.assertCounters(
+			total_exercises_completed=2, total_sets_played=6, total_reps_played=20,
+			total_chest_exercises=1, total_biceps_exercises=1
+		)
+
+	def test_edited_completed_plan_replaces_its_contribution(self):
+		plan = make_plan(self.client.name, self.membership.name, exercises=[self.bench, self.curl])
+		plan.d1_e = [row for row in plan.d1_e if row.exercise == self.bench]
+		plan.d1_e[0].sets = 5
+		plan.save()
+		self.assertCounters(
+			total_exercises_completed=1, total_sets_played=5, total_reps_played=10, total_chest_exercises=1
+		)
+
+	def test_deleted_completed_plan_removes_counters(self):
+		make_plan(self.client.name, self.membership.name, exercises=[self.bench])
+		plan = make_plan(self.client.name, self.membership.name, exercises=[self.curl])
+		frappe.delete_doc("Plan", plan.name)
+		self.assertCounters(
+			total_exercises_completed=1, total_sets_played=3, total_reps_played=10, total_chest_exercises=1
+		)
+
+	def test_plan_not_completed_adds_nothing(self):
+		membership = make_membership(self.client.name)
+		plan = make_plan(self.client.name, membership.name, exercises=[self.bench])
+		self.assertNotEqual(plan.status, "Completed")
+		self.assertCounters()
+
+	def test_incremental_counters_match_full_aggregation(self):
+		first = make_plan(self.client.name, self.membership.name, exercises=[self.bench, self.curl])
+		make_plan(self.client.name, self.membership.name, exercises=[self.curl, self.curl])
+		first.d1_e.pop()
+		first.save()
+
+		expected = aggregate_exercise_counters(clients=[self.client.name])[self.client.name]
+		self.assertEqual(dict(self.get_counters()), expected)
+
+	def test_reconcile_repairs_drifted_counters(self):
+		make_plan(self.client.name, self.membership.name, exercises=[self.bench])
+		frappe.db.set_value("Client", self.client.name, {
+			"total_exercises_completed": 99, "total_chest_exercises": 0
+		}, update_modified=False)
+
+		self.assertGreaterEqual(reconcile_client_statistics(), 1)
+		self.assertCounters(
+			total_exercises_completed=1, total_sets_played=3, total_reps_played=10, total_chest_exercises=1
+		)
+		self.assertTrue(frappe.db.get_value("Client", self.client.name, "total_calories_burned"))
+
+	def test_client_without_bmr_data_is_skipped_by_both_paths(self):
+		client = make_client()
+		membership = make_membership(client.name, start=add_days(now_datetime(), -60))
+		make_plan(client.name, membership.name, exercises=[self.bench])
+		counters = frappe.db.get_value("Client", client.name, COUNTER_FIELDS, as_dict=True)
+		self.assertEqual(dict(counters), empty_counters())
+
+		reconcile_client_statistics()
+		self.assertEqual(frappe.db.get_value("Client", client.name, COUNTER_FIELDS, as_dict=True), counters)
+
+	def log_performance(self, exercise, weight, reps, logged_at):
+		"""Record a performance like update_client does, then add its row"""
+		record_performance(self.client, exercise, weight, reps, get_datetime(logged_at))
+		self.client.append("exercise_performance", {"exercise": exercise, "weight": weight, "reps": reps})
+		self.client.save()
+
+	def test_record_performance_levels_up_only_above_the_previous_best(self):
+		self.log_performance(self.bench, 50, 10, "2024-01-01 07:30:00")
+		self.assertEqual((self.client.personal_record_setter, self.client.level_up), (1, 0))
+		self.assertEqual((self.client.early_workouts_count, self.client.late_workouts_count), (1, 0))
+
+		self.log_performance(self.bench, 50, 10, "2024-01-02 20:00:00")
+		self.assertEqual(self.client.level_up, 0)
+		self.assertEqual((self.client.early_workouts_count, self.client.late_workouts_count), (1, 1))
+
+		# The best of another exercise does not count
+		self.log_performance(self.curl, 20, 8, "2024-01-03 13:00:00")
+		self.assertEqual(self.client.level_up, 0)
+
+		self.log_performance(self.bench, 55, 8, "2024-01-04 13:00:00")
+		self.assertEqual(self.client.level_up, 1)
+
+	def test_record_logged_exercise_awards_counter_achievements(self):
+		record_logged_exercise(self.client)
+		self.assertEqual((self.client.first_step, self.client.stress_buster), (1, 0))
+		for _ in range(STRESS_BUSTER_LOGS - 1):
+			record_logged_exercise(self.client)
+		self.assertEqual(self.client.logged_exercises_count, STRESS_BUSTER_LOGS)
+		self.assertEqual(self.client.stress_buster, 1)
+
+	def test_record_weight_awards_weight_achievements(self):
+		client = make_client()
+		client.height = 180
+		client.target_weight = 75
+		for weight in (82, 80.5):
+			client.append("weight", {"weight": weight, "date": now_datetime()})
+		record_weight(client)
+		self.assertEqual(
+			(client.first_kilo_lost, client.bmi_boss, client.halfway_there,
+				client.total_transformation),
+			(1, 1, 0, 0)
+		)
+
+		client.append("weight", {"weight": 78, "date": now_datetime()})
+		record_weight(client)
+		self.assertEqual((client.halfway_there, client.total_transformation), (1, 0))
+
+	def test_nightly_achievements_leave_unchanged_clients_alone(self):
+		earned = self.client.name
+		unchanged = make_client().name
+		frappe.db.set_value("Client", earned, "logged_exercises_count", 1, update_modified=False)
+		before = {
+			name: frappe.db.get_value("Client", name, ["modified", "first_step"], as_dict=True)
+			for name in (earned, unchanged)
+		}
+
+		self.assertEqual(update_clients_achievements([earned, unchanged]), 1)
+
+		after = {
+			name: frappe.db.get_value("Client", name, ["modified", "first_step"], as_dict=True)
+			for name in (earned, unchanged)
+		}
+		self.assertEqual(after[earned].first_step, 1)
+		self.assertEqual(after[earned].modified, before[earned].modified)
+		self.assertEqual(after[unchanged], before[unchanged])
+		self.assertEqual(update_clients_achievements([earned, unchanged]), 0)
+
+
+class TestClientJobs(IntegrationTestCase):
+	"""Daily client jobs fanned out over lanes, run with a stub job recording the chunks it processes"""
+
+	def setUp(self):
+		self.run_date = "2000-01-01"
+		self.processed = []
+		self.failing = set()
+		self.enqueued = []
+		jobs = {"test": {"clients": lambda: [f"client-{i}" for i in range(5)], "process": self.process}}
+		for patcher in (
+			patch.dict("personal_trainer_app.client_jobs.CLIENT_JOBS", jobs, clear=True),
+			patch("personal_trainer_app.client_jobs.frappe.enqueue", side_effect=self.enqueue),
+			# Lanes commit each chunk, keep the test transaction open
+			patch.object(frappe.db, "commit"),
+			patch.object(frappe.db, "rollback"),
+		):
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		set_settings(self, client_job_chunk_size=2, client_job_lanes=2)
+
+	def tearDown(self):
+		for run_date in {self.run_date, nowdate(), str(add_days(nowdate(), -1))}:
+			frappe.cache().delete_value([
+				get_chunks_key("test", run_date), get_done_key("test", run_date),
+				*(get_attempts_key("test", run_date, index) for index in range(3))
+			])
+
+	def process(self, clients):
+		if set(clients) & self.failing:
+			raise frappe.ValidationError("chunk failed")
+		self.processed.append(clients)
+		return len(clients)
+
+	def enqueue(self, method, **kwargs):
+		self.enqueued.append(kwargs)
+
+	def run_enqueued_lanes(self):
+		lanes, self.enqueued = self.enqueued, []
+		for kwargs in lanes:
+			run_client_job_lane(kwargs["job"], kwargs["run_date"], kwargs["lane"], kwargs["lanes"])
+		return lanes
+
+	def test_chunks_are_checkpointed(self):
+		start_client_job("test", self.run_date)
+		self.assertEqual(len(self.run_enqueued_lanes()), 2)
+
+		self.assertEqual(sorted(self.processed), [["client-0", "client-1"], ["client-2", "client-3"], ["client-4"]])
+		self.assertEqual(get_pending_chunks("test", self.run_date, 3), [])
+		resume_client_job("test", self.run_date)
+		self.assertEqual(self.enqueued, [])
+
+	def test_failed_chunk_is_retried(self):
+		self.failing = {"client-2"}
+		start_client_job("test", self.run_date)
+		self.run_enqueued_lanes()
+		self.assertEqual(get_pending_chunks("test", self.run_date, 3), [1])
+
+		self.failing = set()
+		resume_client_job("test", self.run_date)
+		self.run_enqueued_lanes()
+		self.assertEqual(len(self.processed), 3)
+		self.assertEqual(self.processed[-1], ["client-2", "client-3"])
+		self.assertEqual(get_pending_chunks("test", self.run_date, 3), [])
+
+	def test_chunk_out_of_attempts_is_given_up(self):
+		self.failing = {"client-2"}
+		start_client_job("test", self.run_date)
+		for _ in range(CLIENT_JOB_MAX_ATTEMPTS):
+			self.run_enqueued_lanes()
+			resume_client_job("test", self.run_date)
+		self.assertEqual(get_pending_chunks("test", self.run_date, 3), [])
+		self.assertEqual(self.enqueued, [])
+
+	def test_resume_keeps_the_lane_count_of_the_run(self):
+		start_client_job("test", self.run_date)
+		# Only lane 0 ran before the run was interrupted
+		first, self.enqueued = self.enqueued[0], []
+		run_client_job_lane(first["job"], first["run_date"], first["lane"], first["lanes"])
+
+		set_settings(self, client_job_lanes=3)
+		resume_client_job("test", self.run_date)
+		self.assertEqual({kwargs["lanes"] for kwargs in self.enqueued}, {2})
+		self.run_enqueued_lanes()
+
+		self.assertEqual(sorted(self.processed), [["client-0", "client-1"], ["client-2", "client-3"], ["client-4"]])
+
+	def test_hourly_resume_picks_up_yesterdays_run(self):
+		self.run_date = str(add_days(nowdate(), -1))
+		start_client_job("test", self.run_date)
+		self.enqueued = []
+
+		resume_client_jobs()
+		self.assertEqual({kwargs["run_date"] for kwargs in self.enqueued}, {self.run_date})
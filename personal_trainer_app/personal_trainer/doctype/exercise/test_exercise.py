@@ -1,9 +1,19 @@
 # Copyright (c) 2024, YZ and Contributors
 # See license.txt
 
-# import frappe
+import csv
+import io
+from unittest.mock import patch
+
+import frappe
 from frappe.tests import IntegrationTestCase, UnitTestCase
 
+from personal_trainer_app.api import MembershipCache, resolve_library_references
+from personal_trainer_app.exercise_import import EXERCISE_COLUMNS, SECONDARY_MUSCLE_COLUMN, iter_exercises
+from personal_trainer_app.tests.utils import (
+	make_client, make_exercise, make_membership, make_plan, run_after_commit
+)
+
 
 # On IntegrationTestCase, the doctype test records and all
 # link-field test record depdendencies are recursively loaded
@@ -12,13 +22,43 @@ EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 
 
-class TestExercise(UnitTestCase):
+def exercises_csv(*rows):
+	"""Exercises CSV from (exercise, primary muscle, secondary muscle) rows"""
+	file = io.StringIO()
+	writer = csv.DictWriter(file, fieldnames=["Exercise", *EXERCISE_COLUMNS, SECONDARY_MUSCLE_COLUMN])
+	writer.writeheader()
+	for exercise, primary, secondary in rows:
+		writer.writerow({"Exercise": exercise, "PrimaryMuscle": primary, SECONDARY_MUSCLE_COLUMN: secondary})
+	file.seek(0)
+	return file
+
+
+class UnitTestExercise(UnitTestCase):
 	"""
 	Unit tests for Exercise.
 	Use this class for testing individual functions and methods.
 	"""
 
-	pass
+	def test_continuation_rows_add_secondary_muscles(self):
+		exercises = list(iter_exercises(exercises_csv(
+			("Deadlift", "Hamstrings", "Glutes"),
+			("", "", "Lower Back"),
+			("", "", "Glutes"),
+			("", "", ""),
+			("Plank", "Abdominals", ""),
+			("", "", "Shoulders"),
+		)))
+		self.assertEqual(
+			[(name, fields["primary_muscle"], muscles) for name, fields, muscles in exercises],
+			[("Deadlift", "Hamstrings", ["Glutes", "Lower Back"]), ("Plank", "Abdominals", ["Shoulders"])]
+		)
+
+	def test_leading_continuation_row_is_ignored(self):
+		exercises = list(iter_exercises(exercises_csv(
+			("", "", "Traps"),
+			("Shrug", "Traps", ""),
+		)))
+		self.assertEqual([(name, muscles) for name, _fields, muscles in exercises], [("Shrug", [])])
 
 
 class TestExercise(IntegrationTestCase):
@@ -27,4 +67,72 @@ class TestExercise(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
\ No newline at end of file
+	def setUp(self):
+		self.cache = MembershipCache()
+		self.exercise = make_exercise("Test Reverse Index Squat")
+		client = make_client()
+		self.membership = make_membership(client.name)
+		self.plan = make_plan(client.name, self.membership.name, exercises=[self.exercise.name])
+		run_after_commit()
+
+	def get_dependents(self):
+		return {
+			member.decode()
+			for member in frappe.cache().smembers(self.cache.get_library_dependents_key("Exercise", self.exercise.name))
+		}
+
+	def save_exercise(self):
+		self.exercise.instructions = frappe.generate_hash()
+		self.exercise.save()
+		run_after_commit()
+
+	def test_plan_save_indexes_exercise(self):
+		self.assertIn(f"{self.membership.name}:{self.plan.name}", self.get_dependents())
+
+	def test_removed_exercise_leaves_index_after_commit(self):
+		self.plan.d1_e = []
+		self.plan.save()
+		self.assertIn(f"{self.membership.name}:{self.plan.name}", self.get_dependents())
+		run_after_commit()
+		self.assertNotIn(f"{self.membership.name}:{self.plan.name}", self.get_dependents())
+
+	def test_rolled_back_plan_edit_keeps_index(self):
+		self.plan.d1_e = []
+		self.plan.save()
+		frappe.db.after_commit.reset()
+		self.assertIn(f"{self.membership.name}:{self.plan.name}", self.get_dependents())
+
+	def test_plan_insert_indexes_once(self):
+		with patch.object(MembershipCache, "index_library_dependents") as index:
+			make_plan(self.plan.client, self.membership.name, exercises=[self.exercise.name])
+			run_after_commit()
+		index.assert_called_once()
+
+	def test_exercise_edit_bumps_dependent_membership(self):
+		version = self.cache.get_membership_version(self.membership.name)
+		self.save_exercise()
+		self.assertNotEqual(self.cache.get_membership_version(self.membership.name), version)
+
+	def test_index_is_rebuilt_after_redis_loses_it(self):
+		frappe.cache().delete_value([
+			self.cache.get_library_dependents_marker_key(),
+			self.cache.get_library_dependents_key("Exercise", self.exercise.name),
+			self.cache.get_plan_dependencies_key(self.plan.name)
+		])
+		version = self.cache.get_membership_version(self.membership.name)
+		self.save_exercise()
+		self.assertNotEqual(self.cache.get_membership_version(self.membership.name), version)
+		self.assertIn(f"{self.membership.name}:{self.plan.name}", self.get_dependents())
+
+	def test_library_entry_is_evicted_after_commit(self):
+		resolve_library_references("Exercise", {self.exercise.name})
+		self.exercise.instructions = frappe.generate_hash()
+		self.exercise.save()
+		self.assertIn(self.exercise.name, self.cache.get_cached_library_items("Exercise", [self.exercise.name]))
+
+		run_after_commit()
+		self.assertNotIn(self.exercise.name, self.cache.get_cached_library_items("Exercise", [self.exercise.name]))
+		self.assertEqual(
+			resolve_library_references("Exercise", {self.exercise.name})[self.exercise.name]["instructions"],
+			self.exercise.instructions
+		)
@@ -0,0 +1,144 @@
+# Copyright (c) 2024, YZ and Contributors
+# See license.txt
+
+import tempfile
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase, UnitTestCase
+
+from personal_trainer_app.config.nutrition import NUTRIENT_MAPPING, NutrientResolver
+from personal_trainer_app.fdc import FDC_BATCH_SIZE, fetch_fdc_foods, import_foods
+from personal_trainer_app.tests.fdc_stub import FDCStub, make_fdc_food
+from personal_trainer_app.tests.utils import set_settings
+
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record depdendencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+TEST_FDC_KEY = "test-key"
+
+
+class FDCStubMixin:
+	"""Point the FDC pipeline at a local stub and an empty response cache"""
+
+	def use_stub(self, stub):
+		stub.__enter__()
+		self.addCleanup(stub.__exit__, None, None, None)
+
+		cache_dir = tempfile.TemporaryDirectory()
+		self.addCleanup(cache_dir.cleanup)
+		for patcher in (
+			patch.dict(frappe.conf, {"fdc_base_url": stub.base_url}),
+			patch("personal_trainer_app.fdc.get_fdc_cache_dir", return_value=cache_dir.name),
+		):
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		return stub
+
+
+class UnitTestFood(FDCStubMixin, UnitTestCase):
+	"""
+	Unit tests for Food.
+	Use this class for testing individual functions and methods.
+	"""
+
+	def test_resolver_matches_exact_names_then_whole_words(self):
+		resolver = NutrientResolver(NUTRIENT_MAPPING)
+		fuzzy = resolver.fuzzy_rank_offset
+		self.assertEqual(resolver.resolve("Total lipid (fat)"), ("fat", 0))
+		self.assertEqual(resolver.resolve("Protein"), ("protein", 0))
+		self.assertEqual(resolver.resolve("Energy (kJ)"), ("energy", fuzzy + 2))
+		self.assertEqual(resolver.resolve("Carbs (net)"), ("carbs", fuzzy + 3))
+		# Exact names always rank before fuzzy ones
+		self.assertLess(resolver.resolve("kcal")[1], fuzzy)
+
+	def test_resolver_ignores_names_only_containing_a_variation(self):
+		resolver = NutrientResolver(NUTRIENT_MAPPING)
+		for nutrient in ("Fatty acids, total trans", "Fatty acids, total saturated", "Proteinase", "Caloriesless"):
+			self.assertIsNone(resolver.resolve(nutrient), nutrient)
+
+	def test_resolver_ranks_energy_variants(self):
+		resolver = NutrientResolver(NUTRIENT_MAPPING)
+		specific, general, plain, kilojoules = (
+			frappe._dict(nutrient=nutrient) for nutrient in (
+				"Energy (Atwater Specific Factors)", "Energy (Atwater General Factors)", "Energy", "Energy (kJ)"
+			)
+		)
+		self.assertIs(resolver.resolve_facts([kilojoules, plain, general, specific])["energy"], specific)
+		self.assertIs(resolver.resolve_facts([kilojoules, plain, general])["energy"], general)
+		self.assertIs(resolver.resolve_facts([kilojoules, plain])["energy"], plain)
+		self.assertIs(resolver.resolve_facts([kilojoules, frappe._dict(nutrient=None)])["energy"], kilojoules)
+
+	def test_fetch_in_batches(self):
+		fdcids = [str(900000 + i) for i in range(FDC_BATCH_SIZE * 2 + 5)]
+		stub = self.use_stub(FDCStub([make_fdc_food(fdcid, f"Food {fdcid}") for fdcid in fdcids]))
+
+		foods, errors = fetch_fdc_foods(fdcids, TEST_FDC_KEY)
+
+		self.assertEqual(errors, {})
+		self.assertEqual(set(foods), set(fdcids))
+		self.assertEqual(sorted(len(batch) for batch in stub.batches), [5, FDC_BATCH_SIZE, FDC_BATCH_SIZE])
+
+	def test_fetch_retries_transient_errors(self):
+		stub = self.use_stub(FDCStub([make_fdc_food("900001", "Apple")], failures=2))
+
+		foods, errors = fetch_fdc_foods(["900001"], TEST_FDC_KEY)
+
+		self.assertEqual(errors, {})
+		self.assertIn("900001", foods)
+		self.assertEqual(stub.calls, 3)
+
+	def test_fetch_reports_failed_batches(self):
+		# Client errors are not retried
+		self.use_stub(FDCStub([make_fdc_food("900001", "Apple")], failures=1, failure_status=400))
+
+		foods, errors = fetch_fdc_foods(["900001"], TEST_FDC_KEY)
+
+		self.assertEqual(foods, {})
+		self.assertIn("900001", errors)
+
+	def test_fetch_reports_unknown_foods(self):
+		self.use_stub(FDCStub([make_fdc_food("900001", "Apple")]))
+
+		foods, errors = fetch_fdc_foods(["900001", "900002"], TEST_FDC_KEY)
+
+		self.assertEqual(set(foods), {"900001"})
+		self.assertEqual(set(errors), {"900002"})
+
+	def test_fetch_serves_cached_responses_offline(self):
+		stub = self.use_stub(FDCStub([make_fdc_food("900001", "Apple")]))
+		fetch_fdc_foods(["900001"], TEST_FDC_KEY)
+
+		# No API key and no stub call needed once every food is on disk
+		foods, errors = fetch_fdc_foods(["900001"], None)
+
+		self.assertEqual(errors, {})
+		self.assertEqual(foods["900001"]["description"], "Apple")
+		self.assertEqual(stub.calls, 1)
+
+
+class TestFood(FDCStubMixin, IntegrationTestCase):
+	"""
+	Integration tests for Food.
+	Use this class for testing interactions between multiple components.
+	"""
+
+	def test_import_foods(self):
+		self.use_stub(FDCStub([
+			make_fdc_food("900101", "Oats, rolled", [("Protein", 13.2, "g"), ("Energy", 379, "kcal")]),
+			make_fdc_food("900102", "Rice, white", [("Protein", 2.7, "g")]),
+		]))
+		set_settings(self, fdc_api=TEST_FDC_KEY, auto_image=0)
+
+		count = import_foods([{"fdcid": "900101", "image": "/oats.png"}, {"fdcid": "900102", "image": ""}])
+
+		self.assertEqual(count, 2)
+		oats = frappe.get_doc("Food", "900101")
+		self.assertEqual(oats.title, "Oats")
+		self.assertEqual(oats.image, "/oats.png")
+		self.assertEqual(oats.protein_100g, 13.2)
+		self.assertTrue(frappe.db.exists("Food", "900102"))
@@ -4,6 +4,7 @@
 import frappe
 from frappe.model.document import Document
 from frappe.utils import now_datetime, add_to_date, get_datetime
+from personal_trainer_app.transitions import apply_membership_transitions, get_window_next_transition
 
 class Membership(Document):
     def validate(self):
@@ -11,6 +12,7 @@ class Membership(Document):
             self.set_membership_dates()
         
         self.set_active_status()
+        self.next_transition_at = get_window_next_transition(self.active, self.start, self.end)
     
     def set_membership_dates(self):
         if self.package:
@@ -37,36 +39,12 @@ class Membership(Document):
 @frappe.whitelist()
 def update_membership_statuses():
     """
-    Background job to update active status of all memberships.
-    This runs hourly via the scheduler.
+    Update active status of the memberships that are due.
+    Runs hourly as part of transitions.run_due_transitions.
     """
-    frappe.log("Starting membership status update job")
     try:
-        # Get all memberships that are currently marked as active
-        active_memberships = frappe.get_all(
-            "Membership",
-            filters={"active": 1},
-            fields=["name", "start", "end"]
-        )
-        
-        current_time = now_datetime()
-        
-        for membership in active_memberships:
-            end_time = get_datetime(membership.end)
-            
-            # If membership has expired, set active to 0
-            if current_time > end_time:
-                frappe.db.set_value(
-                    "Membership",
-                    membership.name,
-                    "active",
-                    0,
-                    update_modified=False
-                )
-        
+        changed = apply_membership_transitions(now_datetime())
         frappe.db.commit()
-        
-        frappe.log(f"Membership status update completed. Checked {len(active_memberships)} active memberships.")
-        
+        frappe.log(f"Membership status update completed. Updated {len(changed)} memberships.")
     except Exception as e:
-        frappe.log_error("Membership Status Update Error")
\ No newline at end of file
+        frappe.log_error("Membership Status Update Error")
@@ -1,8 +1,21 @@
 # Copyright (c) 2024, YZ and Contributors
 # See license.txt
 
-# import frappe
+import pickle
+from unittest.mock import patch
+
+import frappe
 from frappe.tests import IntegrationTestCase, UnitTestCase
+from frappe.utils import add_to_date, get_datetime, now_datetime
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from personal_trainer_app.api import (
+	MembershipCache, enqueue_membership_warmup, get_membership, get_membership_delta, get_membership_plans,
+	load_membership_data, warm_active_membership_caches, warm_membership_cache
+)
+from personal_trainer_app.tests.utils import make_client, make_membership, make_plan, run_after_commit
+from personal_trainer_app.transitions import apply_membership_transitions, window_transition
 
 
 # On IntegrationTestCase, the doctype test records and all
@@ -12,13 +25,18 @@ EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 
 
-class TestMembership(UnitTestCase):
+class UnitTestMembership(UnitTestCase):
 	"""
 	Unit tests for Membership.
 	Use this class for testing individual functions and methods.
 	"""
 
-	pass
+	def test_window_transition(self):
+		start, end = get_datetime("2024-01-01 10:00:00"), get_datetime("2024-03-31 10:00:00")
+		self.assertEqual(window_transition(start, end, get_datetime("2024-01-01 09:59:59")), (0, start))
+		self.assertEqual(window_transition(start, end, start), (1, end))
+		self.assertEqual(window_transition(start, end, end), (1, end))
+		self.assertEqual(window_transition(start, end, get_datetime("2024-03-31 10:00:01")), (0, None))
 
 
 class TestMembership(IntegrationTestCase):
@@ -27,4 +45,264 @@ class TestMembership(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
\ No newline at end of file
+	def setUp(self):
+		self.cache = MembershipCache()
+		self.client = make_client()
+		self.membership = make_membership(self.client.name)
+		run_after_commit()
+
+	def test_version_is_bumped_after_commit(self):
+		version = self.cache.get_membership_version(self.membership.name)
+		make_plan(self.client.name, self.membership.name)
+		self.assertEqual(self.cache.get_membership_version(self.membership.name), version)
+
+		run_after_commit()
+		self.assertNotEqual(self.cache.get_membership_version(self.membership.name), version)
+
+	def test_rolled_back_change_keeps_version(self):
+		version = self.cache.get_membership_version(self.membership.name)
+		self.cache.invalidate_membership_cache(self.membership.name)
+		frappe.db.after_commit.reset()
+		self.assertEqual(self.cache.get_membership_version(self.membership.name), version)
+
+	def test_invalidate_membership_caches_bumps_every_membership(self):
+		other = make_membership(make_client().name)
+		versions = {m: self.cache.get_membership_version(m) for m in (self.membership.name, other.name)}
+		self.cache.invalidate_membership_caches(list(versions))
+		run_after_commit()
+		for membership, version in versions.items():
+			self.assertNotEqual(self.cache.get_membership_version(membership), version)
+
+	def test_lost_counter_is_seeded_ahead(self):
+		version = self.cache.get_membership_version(self.membership.name)
+		frappe.cache().delete_value(self.cache.get_version_counter_key(self.membership.name))
+		new_version = self.cache.get_membership_version(self.membership.name)
+		self.assertGreater(int(new_version.rsplit(".", 1)[1]), int(version.rsplit(".", 1)[1]))
+
+	def test_plan_pages_keep_plans_sharing_a_start_date(self):
+		plans = [make_plan(self.client.name, self.membership.name).name for _ in range(3)]
+		for plan in plans:
+			frappe.db.set_value("Plan", plan, {"status": "Completed", "start": "2024-01-01", "end": "2024-01-07"})
+
+		seen = []
+		page = {"has_more": True, "before": None, "before_name": None}
+		while page["has_more"]:
+			page = get_membership_plans(self.membership.name, page["before"], page["before_name"], limit=1)
+			seen.extend(plan["plan_name"] for plan in page["plans"])
+
+		self.assertEqual(sorted(seen), sorted(plans))
+		self.assertEqual(len(seen), len(set(seen)))
+
+	def test_delta_unchanged(self):
+		full = get_membership_delta(self.membership.name)
+		self.assertTrue(full["full"])
+
+		delta = get_membership_delta(self.membership.name, full["version"])
+		self.assertTrue(delta["unchanged"])
+		self.assertEqual(delta["version"], full["version"])
+
+	def test_delta_sends_changed_and_deleted_plans(self):
+		kept = make_plan(self.client.name, self.membership.name)
+		removed = make_plan(self.client.name, self.membership.name)
+		run_after_commit()
+		version = get_membership_delta(self.membership.name)["version"]
+
+		kept.target_water = (kept.target_water or 0) + 500
+		kept.save()
+		frappe.delete_doc("Plan", removed.name)
+		run_after_commit()
+
+		delta = get_membership_delta(self.membership.name, version)
+		self.assertFalse(delta["full"])
+		self.assertEqual([plan["plan_name"] for plan in delta["plans"]], [kept.name])
+		self.assertEqual(delta["deleted_plans"], [removed.name])
+		self.assertEqual(delta["out_of_window_plans"], [])
+
+	def test_delta_reports_plans_leaving_the_window(self):
+		older = make_plan(self.client.name, self.membership.name)
+		newer = make_plan(self.client.name, self.membership.name)
+		frappe.db.set_value("Plan", older.name, {"status": "Completed", "start": "2024-01-01", "end": "2024-01-07"})
+		frappe.db.set_value("Plan", newer.name, {"status": "Completed", "start": "2024-01-08", "end": "2024-01-14"})
+		self.cache.invalidate_membership_cache(self.membership.name)
+		run_after_commit()
+
+		previous = frappe.db.get_single_value("PT Settings", "membership_completed_plans")
+		frappe.db.set_single_value("PT Settings", "membership_completed_plans", 0)
+		version = get_membership_delta(self.membership.name)["version"]
+
+		frappe.db.set_single_value("PT Settings", "membership_completed_plans", 1)
+		self.cache.invalidate_membership_cache(self.membership.name)
+		run_after_commit()
+		try:
+			delta = get_membership_delta(self.membership.name, version)
+		finally:
+			frappe.db.set_single_value("PT Settings", "membership_completed_plans", previous)
+
+		self.assertEqual(delta["deleted_plans"], [])
+		self.assertEqual(delta["out_of_window_plans"], [older.name])
+
+	def test_compressed_cache_keeps_a_single_payload_copy(self):
+		plan = make_plan(self.client.name, self.membership.name)
+		run_after_commit()
+		previous = frappe.db.get_single_value("PT Settings", "compress_membership_cache")
+		frappe.db.set_single_value("PT Settings", "compress_membership_cache", 1)
+		try:
+			data, version = load_membership_data(self.membership.name)
+			self.assertIsNone(frappe.cache().get_value(self.cache.get_membership_cache_key(self.membership.name)))
+			self.assertIsNotNone(self.cache.get_cached_membership_response(self.membership.name, version, "message"))
+
+			cached_data, cached_version = self.cache.get_cached_membership_entry(self.membership.name)
+			self.assertEqual(cached_version, version)
+			self.assertEqual([p["plan_name"] for p in cached_data["plans"]], [plan.name])
+		finally:
+			frappe.db.set_single_value("PT Settings", "compress_membership_cache", previous)
+
+	def hold_rebuild_lock(self):
+		"""Take the rebuild lock as another worker would"""
+		token = self.cache.acquire_rebuild_lock(self.membership.name)
+		self.assertTrue(token)
+		self.addCleanup(self.cache.release_rebuild_lock, self.membership.name, token)
+
+	def use_uncompressed_cache(self):
+		previous = frappe.db.get_single_value("PT Settings", "compress_membership_cache")
+		frappe.db.set_single_value("PT Settings", "compress_membership_cache", 0)
+		self.addCleanup(frappe.db.set_single_value, "PT Settings", "compress_membership_cache", previous)
+
+	def test_lock_holder_rebuilds_and_releases_the_lock(self):
+		data, version = load_membership_data(self.membership.name)
+		self.assertIn("plans", data)
+		self.assertEqual(version, self.cache.get_membership_version(self.membership.name))
+		self.assertEqual(self.cache.get_cached_membership_entry(self.membership.name, fresh=True)[1], version)
+		self.hold_rebuild_lock()
+
+	def test_stale_payload_is_served_while_another_worker_rebuilds(self):
+		_, cached_version = load_membership_data(self.membership.name)
+		self.cache.bump_membership_version(self.membership.name)
+		self.hold_rebuild_lock()
+
+		with patch("personal_trainer_app.api.build_membership_data") as build:
+			data, version = load_membership_data(self.membership.name)
+
+		build.assert_not_called()
+		self.assertIn("plans", data)
+		self.assertEqual(version, cached_version)
+
+	def test_cold_waiter_picks_up_the_rebuild_of_another_worker(self):
+		self.use_uncompressed_cache()
+		membership = self.membership.name
+		data_key = self.cache.get_membership_cache_key(membership)
+		version_key = self.cache.get_plans_version_key(membership)
+		frappe.cache().delete_value([data_key, version_key])
+		version = self.cache.get_membership_version(membership)
+		payload = {"plans": [], "references": {}}
+		self.hold_rebuild_lock()
+
+		def rebuild_finishes_elsewhere(seconds):
+			# Written by another process, this request's local cache never sees it
+			redis = frappe.cache()
+			redis.set(redis.make_key(data_key), pickle.dumps(payload))
+			redis.set(redis.make_key(version_key), pickle.dumps(version))
+
+		with patch("personal_trainer_app.api.time.sleep", side_effect=rebuild_finishes_elsewhere) as sleep, \
+				patch("personal_trainer_app.api.build_membership_data") as build:
+			result = load_membership_data(membership)
+
+		build.assert_not_called()
+		self.assertEqual(sleep.call_count, 1)
+		self.assertEqual(result, (payload, version))
+
+	def request_membership(self, if_none_match=None):
+		"""Call get_membership as an HTTP request, sending If-None-Match when given"""
+		headers = {"If-None-Match": f'"{if_none_match}"'} if if_none_match else {}
+		environ = EnvironBuilder(path="/api/method/personal_trainer_app.api.get_membership", headers=headers)
+		previous = getattr(frappe.local, "request", None)
+		frappe.local.request = Request(environ.get_environ())
+		try:
+			return get_membership(self.membership.name)
+		finally:
+			frappe.local.request = previous
+
+	def test_matching_etag_is_not_modified(self):
+		make_plan(self.client.name, self.membership.name)
+		run_after_commit()
+		response = self.request_membership()
+		self.assertEqual(response.status_code, 200)
+		etag, _ = response.get_etag()
+
+		with patch("personal_trainer_app.api.load_membership_data") as load:
+			response = self.request_membership(etag)
+
+		load.assert_not_called()
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response.get_data(), b"")
+		self.assertEqual(response.get_etag()[0], etag)
+
+	def test_etag_changes_after_plan_edit(self):
+		plan = make_plan(self.client.name, self.membership.name)
+		run_after_commit()
+		etag, _ = self.request_membership().get_etag()
+
+		plan.weekly_workouts = 4
+		plan.save()
+		run_after_commit()
+
+		response = self.request_membership(etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response.get_etag()[0], etag)
+
+	def test_warmup_job_is_keyed_by_version(self):
+		with patch("personal_trainer_app.api.frappe.enqueue") as enqueue:
+			enqueue_membership_warmup(self.membership.name)
+			enqueue.assert_not_called()
+			run_after_commit()
+			# A job still running for the old version must not swallow this one
+			self.cache.bump_membership_version(self.membership.name)
+			enqueue_membership_warmup(self.membership.name)
+			run_after_commit()
+
+		job_ids = [call.kwargs["job_id"] for call in enqueue.call_args_list]
+		self.assertEqual(len(job_ids), 2)
+		self.assertNotEqual(job_ids[0], job_ids[1])
+
+	def test_warm_pass_picks_outdated_and_expiring_payloads(self):
+		membership = self.membership.name
+		_, version = load_membership_data(membership)
+		self.assertEqual(self.cache.get_stale_memberships([membership]), [])
+
+		redis = frappe.cache()
+		redis.expire(redis.make_key(self.cache.get_manifest_key(membership, version)), 60)
+		self.assertEqual(self.cache.get_stale_memberships([membership]), [membership])
+		with patch("personal_trainer_app.api.frappe.enqueue") as enqueue:
+			warm_active_membership_caches()
+			run_after_commit()
+		self.assertIn(membership, [call.kwargs["membership"] for call in enqueue.call_args_list])
+
+		warm_membership_cache(membership)
+		self.assertEqual(self.cache.get_stale_memberships([membership]), [])
+
+		self.cache.bump_membership_version(membership)
+		self.assertEqual(self.cache.get_stale_memberships([membership]), [membership])
+
+	def test_due_memberships_follow_window_transition(self):
+		now = now_datetime().replace(microsecond=0)
+		cases = [
+			(0, add_to_date(now, days=-1), add_to_date(now, days=30)),
+			(1, add_to_date(now, days=-30), add_to_date(now, hours=-1)),
+			(1, add_to_date(now, days=2), add_to_date(now, days=30)),
+			(0, now, add_to_date(now, days=30)),
+		]
+		memberships = {}
+		for active, start, end in cases:
+			membership = make_membership(make_client().name)
+			frappe.db.set_value("Membership", membership.name, {
+				"active": active, "start": start, "end": end, "next_transition_at": add_to_date(now, hours=-1)
+			}, update_modified=False)
+			memberships[membership.name] = (active, start, end)
+
+		changed = apply_membership_transitions(now)
+
+		for membership, (active, start, end) in memberships.items():
+			expected = window_transition(start, end, now)
+			stored = frappe.db.get_value("Membership", membership, ["active", "next_transition_at"])
+			self.assertEqual((stored[0], stored[1] and get_datetime(stored[1])), expected)
+			self.assertEqual(membership in changed, expected[0] != active)
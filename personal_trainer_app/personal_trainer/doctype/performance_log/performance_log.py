@@ -1,9 +1,14 @@
 # Copyright (c) 2024, YZ and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
 
 class PerformanceLog(Document):
-	pass
\ No newline at end of file
+	pass
+
+
+def on_doctype_update():
+	# Serves the per-client, per-exercise history window in api.get_performance_history
+	frappe.db.add_index("Performance Log", ["parent", "exercise", "creation"])
@@ -3,13 +3,15 @@
 
 import frappe
 from frappe.model.document import Document
-from frappe.utils import format_date, getdate, add_days, nowdate, get_first_day_of_week, get_last_day_of_week
-from personal_trainer_app.config.nutrition import get_nutrient_mappings
+from frappe.utils import format_date, getdate, add_days, nowdate, now_datetime, get_first_day_of_week, get_last_day_of_week
+from personal_trainer_app.nutrition_engine import NutritionEngine
+from personal_trainer_app.transitions import apply_plan_transitions, get_plan_next_transition
 import json
 
 class Plan(Document):
     def before_save(self):
         self.old_food_hash = self.get('__food_hash')
+        self.next_transition_at = get_plan_next_transition(self)
     def before_insert(self):
         # Fetch membership details
         membership = frappe.get_doc('Membership', self.membership)
@@ -90,19 +92,9 @@ class Plan(Document):
 @frappe.whitelist()
 def update_plan_statuses():
     """
-    Update status of all plans based on current date
+    Update status of the plans that are due, see transitions.run_due_transitions
     """
-    current_date = getdate(nowdate())
-    plans = frappe.get_all('Plan', filters={'status': ['!=', 'Completed']})
-    for plan in plans:
-        plan_doc = frappe.get_doc('Plan', plan.name)
-        if plan_doc.start <= current_date <= plan_doc.end:
-            plan_doc.status = 'Active'
-        elif current_date > plan_doc.end:
-            plan_doc.status = 'Completed'
-        else:
-            plan_doc.status = 'Scheduled'
-        plan_doc.save()
+    apply_plan_transitions(now_datetime())
     frappe.db.commit()
 
 
@@ -118,9 +110,6 @@ def calculate_all_nutritional_totals(all_food_data):
     if isinstance(all_food_data, str):
         all_food_data = json.loads(all_food_data)
 
-    # Get nutrient mappings from config
-    NUTRIENT_MAPPING = get_nutrient_mappings()
-
     # Collect all unique food docnames
     all_food_docnames = {
         item['food_docname'] 
@@ -128,67 +117,25 @@ def calculate_all_nutritional_totals(all_food_data):
         for item in table_data
     }
 
-    # Bulk fetch all food documents
-    food_docs = {}
+    # Read the materialized per 100 g macros of all foods in one query
+    food_nutrients = {}
     if all_food_docnames:
-        food_list = frappe.get_all(
+        foods = frappe.get_all(
             'Food',
             filters={'name': ['in', list(all_food_docnames)]},
-            fields=['name']
-        )
-        
-        food_docs = {
-            doc.name: frappe.get_doc('Food', doc.name) 
-            for doc in food_list
-        }
-
-    def find_nutrient_value(facts, nutrient_type):
-        """
-        Helper function to find nutrient value using the mapping
-        Args:
-            facts (list): List of nutritional facts
-            nutrient_type (str): Type of nutrient to find
-        Returns:
-            float: Nutrient value or 0 if not found
-        """
-        for fact in facts:
-            if any(variation in fact.nutrient for variation in NUTRIENT_MAPPING[nutrient_type]):
-                return fact.value
-        return 0
-
-    # Pre-process nutritional facts for each food
-    food_nutrients = {}
-    for food_name, food_doc in food_docs.items():
-        nutrients = {}
-        if food_doc.nutritional_facts:
-            # Find values for each nutrient type using the mapping
-            for nutrient_type in ['carbs', 'protein', 'fat']:
-                nutrients[nutrient_type] = find_nutrient_value(food_doc.nutritional_facts, nutrient_type)
-        
-        # Calculate energy based on macros
-        nutrients['energy'] = (
-            nutrients.get('carbs', 0) * 4 + 
-            nutrients.get('protein', 0) * 4 + 
-            nutrients.get('fat', 0) * 9
+            fields=['name', 'protein_100g', 'carbs_100g', 'fat_100g']
         )
+        for food in foods:
+            nutrients = {'carbs': food.carbs_100g, 'protein': food.protein_100g, 'fat': food.fat_100g}
+
+            # Calculate energy based on macros
+            nutrients['energy'] = nutrients['carbs'] * 4 + nutrients['protein'] * 4 + nutrients['fat'] * 9
+
+            food_nutrients[food.name] = nutrients
 
-        food_nutrients[food_name] = nutrients
-
-    # Calculate totals for each table
-    results = {}
-    for table_id, food_data in all_food_data.items():
-        totals = {'energy': 0, 'carbs': 0, 'protein': 0, 'fat': 0}
-        
-        for item in food_data:
-            food_name = item['food_docname']
-            if food_name in food_nutrients:
-                amount_multiplier = float(item['amount_in_grams']) / 100
-                nutrients = food_nutrients[food_name]
-                
-                for nutrient_key in totals:
-                    if nutrient_key in nutrients:
-                        totals[nutrient_key] += nutrients[nutrient_key] * amount_multiplier
-        
-        results[table_id] = totals
-
-    return results
\ No newline at end of file
+    # Calculate totals for every table in a single matrix product
+    engine = NutritionEngine(food_nutrients)
+    return engine.daily_totals({
+        table_id: [(item['food_docname'], float(item['amount_in_grams'])) for item in food_data]
+        for table_id, food_data in all_food_data.items()
+    })
\ No newline at end of file
@@ -1,8 +1,14 @@
 # Copyright (c) 2024, YZ and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests import IntegrationTestCase, UnitTestCase
+from frappe.utils import add_days, get_datetime, getdate, now_datetime
+
+from personal_trainer_app.api import DEFAULT_UNITS, select_plan_window
+from personal_trainer_app.nutrition_engine import MACROS, NutritionEngine, base_nutrition_from_references
+from personal_trainer_app.tests.utils import make_client, make_exercise, make_membership, make_plan
+from personal_trainer_app.transitions import apply_plan_transitions, plan_transition
 
 
 # On IntegrationTestCase, the doctype test records and all
@@ -12,13 +18,95 @@ EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 
 
-class TestPlan(UnitTestCase):
+class UnitTestPlan(UnitTestCase):
 	"""
 	Unit tests for Plan.
 	Use this class for testing individual functions and methods.
 	"""
 
-	pass
+	def plan(self, name, status, start=None, end=None):
+		return frappe._dict(name=name, status=status, start=start and getdate(start), end=end and getdate(end))
+
+	def test_plan_window(self):
+		plans = [
+			self.plan("done-1", "Completed", "2024-01-01", "2024-01-07"),
+			self.plan("done-2", "Completed", "2024-01-08", "2024-01-14"),
+			self.plan("done-3", "Completed", "2024-01-15", "2024-01-21"),
+			self.plan("active", "Active", "2024-01-22", "2024-01-28"),
+			self.plan("next", "Scheduled", "2024-01-29", "2024-02-04"),
+			self.plan("later", "Scheduled", "2024-02-05", "2024-02-11"),
+		]
+		self.assertEqual(
+			[p.name for p in select_plan_window(plans, 2)],
+			["done-2", "done-3", "active", "next"]
+		)
+
+	def test_plan_window_without_dates(self):
+		plans = [
+			self.plan("undated-done", "Completed"),
+			self.plan("done", "Completed", "2024-01-01", "2024-01-07"),
+			self.plan("undated-next", "Scheduled"),
+			self.plan("next", "Scheduled", "2024-01-29", "2024-02-04"),
+		]
+		self.assertEqual([p.name for p in select_plan_window(plans, 1)], ["done", "next"])
+
+	def test_plan_transition(self):
+		start, end = getdate("2024-01-08"), getdate("2024-01-14")
+		self.assertEqual(plan_transition(start, end, "2024-01-07"), ("Scheduled", get_datetime("2024-01-08")))
+		self.assertEqual(plan_transition(start, end, "2024-01-08"), ("Active", get_datetime("2024-01-15")))
+		self.assertEqual(plan_transition(start, end, "2024-01-14"), ("Active", get_datetime("2024-01-15")))
+		self.assertEqual(plan_transition(start, end, "2024-01-15"), ("Completed", None))
+
+	def test_engine_nutrition_sums_rounded_foods(self):
+		"""Per-food values are rounded with Python's round, totals are the sums of what is shown"""
+		base_nutrition = {
+			"oats": (379.0, 13.2, 67.7, 6.5),
+			"egg": (143.0, 12.6, 0.7, 9.5),
+			# 4.5 x 10 g is an exact half that np.round alone would round down
+			"seeds": (4.5, 0.45, 1.5, 3.5),
+		}
+		references = {
+			food: {"nutrition_per_100g": {
+				macro: {"value": value, "unit": DEFAULT_UNITS[macro]} for macro, value in zip(MACROS, values)
+			}}
+			for food, values in base_nutrition.items()
+		}
+		references["water"] = {"nutrition_per_100g": None}
+		days = {
+			("plan", 1): [("oats", 10.0), ("egg", 55.0), ("seeds", 10.0), ("water", 250.0)],
+			("plan", 2): [("egg", 15.0), ("egg", 35.0), ("oats", 45.0)],
+			("plan", 3): [],
+		}
+
+		engine = NutritionEngine(base_nutrition_from_references(references))
+		nutrition = engine.daily_nutrition(days, DEFAULT_UNITS)
+
+		for key, items in days.items():
+			foods, totals = nutrition[key]
+			expected_foods = [
+				{
+					macro: {"value": round(value * (amount / 100), 1), "unit": DEFAULT_UNITS[macro]}
+					for macro, value in zip(MACROS, base_nutrition[food])
+				} if food in base_nutrition else None
+				for food, amount in items
+			]
+			self.assertEqual(foods, expected_foods)
+			self.assertEqual(totals, {
+				macro: {
+					"value": round(sum(food[macro]["value"] for food in expected_foods if food), 1),
+					"unit": DEFAULT_UNITS[macro]
+				}
+				for macro in MACROS
+			})
+		self.assertEqual(nutrition[("plan", 1)][0][2]["energy"]["value"], 0.5)
+
+	def test_engine_totals_without_item_rounding(self):
+		"""Plan form totals are not rounded per food"""
+		engine = NutritionEngine({"oats": {"protein": 13.2, "energy": 379}})
+		totals = engine.daily_totals({"d1_f": [("oats", 33.0), ("unknown", 100.0)]})
+		self.assertAlmostEqual(totals["d1_f"]["protein"], 13.2 * 33.0 / 100)
+		self.assertAlmostEqual(totals["d1_f"]["energy"], 379 * 33.0 / 100)
+		self.assertEqual(totals["d1_f"]["fat"], 0)
 
 
 class TestPlan(IntegrationTestCase):
@@ -27,4 +115,54 @@ class TestPlan(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
\ No newline at end of file
+	def setUp(self):
+		self.client = make_client(with_bmr=True)
+		self.membership = make_membership(self.client.name)
+
+	def make_due_plan(self, status, start, end, **kwargs):
+		"""Plan whose stored status may be behind its dates, due for the transition run"""
+		plan = make_plan(self.client.name, self.membership.name, **kwargs)
+		frappe.db.set_value("Plan", plan.name, {
+			"status": status, "start": start, "end": end, "next_transition_at": add_days(now_datetime(), -1)
+		}, update_modified=False)
+		return plan.name
+
+	def test_due_plans_follow_plan_transition(self):
+		today = getdate()
+		cases = [
+			("Active", add_days(today, -20), add_days(today, -14)),
+			("Scheduled", add_days(today, -3), add_days(today, 3)),
+			("Scheduled", today, add_days(today, 6)),
+			("Active", add_days(today, -6), today),
+			("Scheduled", add_days(today, 5), add_days(today, 11)),
+		]
+		plans = {self.make_due_plan(*case): case for case in cases}
+
+		changed = apply_plan_transitions(now_datetime())
+
+		for plan, (status, start, end) in plans.items():
+			expected = plan_transition(start, end, today)
+			stored = frappe.db.get_value("Plan", plan, ["status", "next_transition_at"])
+			self.assertEqual((stored[0], stored[1] and get_datetime(stored[1])), expected)
+			self.assertEqual(plan in [p.name for p in changed], expected[0] != status)
+
+	def test_plan_not_yet_due_is_left_alone(self):
+		today = getdate()
+		plan = self.make_due_plan("Active", add_days(today, -20), add_days(today, -14))
+		frappe.db.set_value("Plan", plan, "next_transition_at", add_days(now_datetime(), 1), update_modified=False)
+
+		apply_plan_transitions(now_datetime())
+		self.assertEqual(frappe.db.get_value("Plan", plan, "status"), "Active")
+
+	def test_plan_completed_by_transition_adds_client_counters(self):
+		today = getdate()
+		exercise = make_exercise("Test Transition Squat", "Glutes").name
+		self.make_due_plan("Active", add_days(today, -20), add_days(today, -14), exercises=[exercise])
+
+		apply_plan_transitions(now_datetime())
+		self.assertEqual(
+			frappe.db.get_value(
+				"Client", self.client.name, ["total_exercises_completed", "total_glutes_exercises"]
+			),
+			(1, 1)
+		)
\ No newline at end of file
@@ -4,6 +4,7 @@
 from frappe.utils import now_datetime, get_datetime
 from frappe.model.document import Document
 import frappe
+from personal_trainer_app.transitions import apply_promo_code_transitions, get_window_next_transition
 
 
 class PromoCode(Document):
@@ -21,14 +22,11 @@ class PromoCode(Document):
                 self.enabled = 1
                 self.manual = 1
 
+        # Manual codes are never switched by the scheduler
+        self.next_transition_at = None if self.manual else get_window_next_transition(self.enabled, self.start, self.end)
+
 
 def update_promo_code_statuses():
-    now = now_datetime()
-    promo_codes = frappe.get_all('PromoC ode', fields=['name', 'start', 'end'])
-    for code in promo_codes:
-        if code.start and code.end:
-            start = get_datetime(code.start)
-            end = get_datetime(code.end)
-            enabled = 1 if start <= now <= end else 0
-            frappe.db.set_value('Promo Code', code.name, 'enabled', enabled)
-            frappe.db.commit()
+    # Only codes whose start or end has passed are touched, see transitions.run_due_transitions
+    apply_promo_code_transitions(now_datetime())
+    frappe.db.commit()
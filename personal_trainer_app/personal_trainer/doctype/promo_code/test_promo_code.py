@@ -1,9 +1,50 @@
 # Copyright (c) 2024, Yamen Zakhour and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, add_to_date, get_datetime, getdate, now_datetime
+
+from personal_trainer_app.transitions import apply_promo_code_transitions, window_transition
 
 
 class TestPromoCode(FrappeTestCase):
-	pass
+	def make_due_code(self, enabled, start, end):
+		"""Scheduled code whose stored flag may be behind its dates, due for the transition run"""
+		code = frappe.get_doc({
+			"doctype": "Promo Code",
+			"code": f"TEST{frappe.generate_hash(length=8).upper()}",
+			"start": start,
+			"end": end,
+		}).insert(ignore_permissions=True)
+		frappe.db.set_value("Promo Code", code.name, {
+			"enabled": enabled, "next_transition_at": add_to_date(now_datetime(), hours=-1)
+		}, update_modified=False)
+		return code.name
+
+	def test_due_codes_follow_window_transition(self):
+		now = now_datetime()
+		today = getdate(now)
+		cases = [
+			(0, add_days(today, -1), add_days(today, 10)),
+			(1, add_days(today, -10), add_days(today, -1)),
+			(1, add_days(today, 1), add_days(today, 10)),
+		]
+		codes = {self.make_due_code(*case): case for case in cases}
+
+		changed = apply_promo_code_transitions(now)
+
+		for code, (enabled, start, end) in codes.items():
+			expected = window_transition(start, end, now)
+			stored = frappe.db.get_value("Promo Code", code, ["enabled", "next_transition_at"])
+			self.assertEqual((stored[0], stored[1] and get_datetime(stored[1])), expected)
+			self.assertEqual(code in changed, expected[0] != enabled)
+
+	def test_manual_code_is_never_scheduled(self):
+		code = frappe.get_doc({
+			"doctype": "Promo Code",
+			"code": f"TEST{frappe.generate_hash(length=8).upper()}",
+			"manual": 1,
+			"enabled": 1,
+		}).insert(ignore_permissions=True)
+		self.assertIsNone(code.next_transition_at)
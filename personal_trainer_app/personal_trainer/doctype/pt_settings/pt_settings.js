@@ -2,15 +2,31 @@
 // For license information, please see license.txt
 
 frappe.ui.form.on('PT Settings', {
+    onload: function(frm) {
+        frappe.realtime.off('exercise_import_complete');
+        frappe.realtime.on('exercise_import_complete', function(data) {
+            frappe.hide_progress();
+            frappe.show_alert({
+                message: __('Successfully imported/updated {0} exercises', [data.count]),
+                indicator: 'green'
+            });
+            frm.reload_doc();
+        });
+        frappe.realtime.off('food_import_complete');
+        frappe.realtime.on('food_import_complete', function(data) {
+            frappe.show_alert({
+                message: __('Successfully imported/updated {0} foods', [data.count]),
+                indicator: 'green'
+            });
+            frm.reload_doc();
+        });
+    },
     fetch_premade_exercises: function(frm) {
         frm.call({
             doc: frm.doc,
             method: 'fetch_premade_exercises',
             freeze: true,
-            freeze_message: __('Importing exercises... Please wait'),
-            callback: function(r) {
-                frm.reload_doc();
-            }
+            freeze_message: __('Queuing exercise import...')
         });
     },
     fetch_premade_foods: function(frm) {
@@ -18,10 +34,7 @@ frappe.ui.form.on('PT Settings', {
             doc: frm.doc,
             method: 'fetch_premade_foods',
             freeze: true,
-            freeze_message: __('Importing foods... Please wait'),
-            callback: function(r) {
-                frm.reload_doc();
-            }
+            freeze_message: __('Queuing food import...')
         });
     }
 });
\ No newline at end of file
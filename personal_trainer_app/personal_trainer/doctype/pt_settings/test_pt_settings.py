@@ -1,9 +1,12 @@
 # Copyright (c) 2024, YZ and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests import IntegrationTestCase, UnitTestCase
 
+from personal_trainer_app.api import MembershipCache
+from personal_trainer_app.tests.utils import make_client, make_membership, run_after_commit
+
 
 # On IntegrationTestCase, the doctype test records and all
 # link-field test record depdendencies are recursively loaded
@@ -27,4 +30,19 @@ class TestPTSettings(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
\ No newline at end of file
+	def test_payload_setting_change_bumps_membership_versions(self):
+		cache = MembershipCache()
+		membership = make_membership(make_client().name).name
+		run_after_commit()
+		version = cache.get_membership_version(membership)
+
+		settings = frappe.get_single("PT Settings")
+		previous = settings.membership_completed_plans
+		settings.membership_completed_plans = (previous or 0) + 1
+		settings.save()
+		run_after_commit()
+		self.assertNotEqual(cache.get_membership_version(membership), version)
+
+		settings.membership_completed_plans = previous
+		settings.save()
+		run_after_commit()
\ No newline at end of file
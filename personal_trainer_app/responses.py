@@ -0,0 +1,65 @@
+import gzip
+import hashlib
+import frappe
+from werkzeug.wrappers import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def make_etag(*parts) -> str:
+    """Build a strong entity tag from the parts identifying a representation"""
+    return hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest()
+
+def is_http_request() -> bool:
+    """Whether we are serving an HTTP request, as opposed to a job or an internal call"""
+    return bool(getattr(frappe.local, "request", None))
+
+def request_matches_etag(etag: str) -> bool:
+    """Whether the client already holds this representation (If-None-Match)"""
+    return frappe.request.if_none_match.contains(etag)
+
+# Keys Frappe wraps whitelisted method results in, v1 first
+RESPONSE_ENVELOPES = ("message", "data")
+
+def get_response_envelope() -> str:
+    """Key Frappe wraps whitelisted method results in, depending on the API version"""
+    return RESPONSE_ENVELOPES[1] if frappe.request.path.startswith("/api/v2/") else RESPONSE_ENVELOPES[0]
+
+# Let browsers keep the body but always revalidate it
+PRIVATE_REVALIDATE = "private, no-cache"
+
+def set_etag_headers(response: Response, etag: str, cache_control: str = PRIVATE_REVALIDATE) -> Response:
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+def not_modified_response(etag: str, cache_control: str = PRIVATE_REVALIDATE) -> Response:
+    """Empty 304 response, the payload is neither built nor serialized"""
+    return set_etag_headers(Response(status=304), etag, cache_control)
+
+def json_response(data, etag: str, cache_control: str = PRIVATE_REVALIDATE) -> Response:
+    """JSON response in the same envelope Frappe would use, tagged with an ETag"""
+    body = frappe.as_json({get_response_envelope(): data}, indent=None)
+    return set_etag_headers(Response(body, status=200, mimetype="application/json"), etag, cache_control)
+
+def compress_json(data, envelope: str = None) -> tuple:
+    """Serialize data in the response envelope once and compress it, brotli when available"""
+    body = frappe.as_json({envelope or get_response_envelope(): data}, indent=None).encode()
+    if brotli:
+        return "br", brotli.compress(body, quality=5)
+    return "gzip", gzip.compress(body, compresslevel=6)
+
+def decompress_body(encoding: str, body: bytes) -> bytes:
+    return brotli.decompress(body) if encoding == "br" else gzip.decompress(body)
+
+def encoded_json_response(encoding: str, body: bytes, etag: str) -> Response:
+    """Stream pre-compressed JSON bytes, decoding only for clients that cannot accept them"""
+    if encoding in frappe.request.accept_encodings:
+        response = Response(body, status=200, mimetype="application/json")
+        response.headers["Content-Encoding"] = encoding
+    else:
+        response = Response(decompress_body(encoding, body), status=200, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    return set_etag_headers(response, etag)
@@ -0,0 +1,87 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_fdc_food(fdcid, description, nutrients=()):
+	"""Food shaped like a "full" response of the FDC multi-food endpoint, nutrients are (name, amount, unit)"""
+	return {
+		"fdcId": int(fdcid),
+		"description": description,
+		"foodCategory": {"description": "Test Foods"},
+		"foodNutrients": [
+			{"type": "FoodNutrient", "amount": amount, "nutrient": {"name": name, "unitName": unit}}
+			for name, amount, unit in nutrients
+		],
+	}
+
+
+class FDCStub:
+	"""
+	Local stand-in for the FDC multi-food endpoint, so imports and tests run offline.
+	Serves the given foods on POST /foods, answers the first `failures` calls with `failure_status`
+	and records the ids of every batch it served.
+	"""
+
+	def __init__(self, foods=(), failures=0, failure_status=503, api_key="test-key"):
+		self.foods = {str(food["fdcId"]): food for food in foods}
+		self.failures = failures
+		self.failure_status = failure_status
+		self.api_key = api_key
+		self.calls = 0
+		self.batches = []
+		self._lock = threading.Lock()
+		self._server = None
+
+	@property
+	def base_url(self):
+		host, port = self._server.server_address
+		return f"http://{host}:{port}"
+
+	def __enter__(self):
+		self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+		threading.Thread(target=self._server.serve_forever, daemon=True).start()
+		return self
+
+	def __exit__(self, *exc):
+		self._server.shutdown()
+		self._server.server_close()
+
+	def _make_handler(self):
+		stub = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_POST(self):
+				body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or "{}")
+				url = urlparse(self.path)
+				if url.path != "/foods":
+					return self._send(404, {"error": "Not found"})
+				if parse_qs(url.query).get("api_key") != [stub.api_key]:
+					return self._send(403, {"error": "Invalid API key"})
+
+				fdcids = [str(fdcid) for fdcid in body.get("fdcIds", [])]
+				with stub._lock:
+					stub.calls += 1
+					fail = stub.failures > 0
+					if fail:
+						stub.failures -= 1
+					else:
+						stub.batches.append(fdcids)
+
+				if fail:
+					return self._send(stub.failure_status, {"error": "Try again"})
+				return self._send(200, [stub.foods[fdcid] for fdcid in fdcids if fdcid in stub.foods])
+
+			def _send(self, status, payload):
+				content = json.dumps(payload).encode()
+				self.send_response(status)
+				self.send_header("Content-Type", "application/json")
+				self.send_header("Content-Length", str(len(content)))
+				self.end_headers()
+				self.wfile.write(content)
+
+			def log_message(self, *args):
+				pass
+
+		return Handler
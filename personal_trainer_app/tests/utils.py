@@ -0,0 +1,82 @@
+import frappe
+from frappe.utils import add_days, now_datetime
+
+
+def run_after_commit():
+	"""Run the callbacks queued for after commit, as a commit would without ending the test transaction"""
+	frappe.db.after_commit.run()
+
+
+def set_settings(test_case, **values):
+	"""Set PT Settings values for the duration of a test"""
+	previous = {field: frappe.db.get_single_value("PT Settings", field) for field in values}
+	frappe.db.set_single_value("PT Settings", values)
+	frappe.clear_document_cache("PT Settings", "PT Settings")
+	test_case.addCleanup(frappe.clear_document_cache, "PT Settings", "PT Settings")
+	test_case.addCleanup(frappe.db.set_single_value, "PT Settings", previous)
+
+
+def make_client(with_bmr=False):
+	"""Client, with the age, height, gender and weight its statistics need when `with_bmr`"""
+	# Plan names are built from the client's first name, keep them unique across tests
+	client_name = f"Test{frappe.generate_hash(length=8)} Client"
+	fields = {
+		"gender": "Male",
+		"date_of_birth": "1990-01-01",
+		"height": 180,
+		"activity_level": "Moderate",
+		"weight": [{"weight": 80, "date": add_days(now_datetime(), -7)}],
+	} if with_bmr else {}
+	return frappe.get_doc({
+		"doctype": "Client", "client_name": client_name, **fields
+	}).insert(ignore_permissions=True)
+
+
+def make_membership(client, start=None, days=90):
+	start = start or add_days(now_datetime(), -1)
+	return frappe.get_doc({
+		"doctype": "Membership",
+		"client": client,
+		"start": start,
+		"end": add_days(start, days),
+	}).insert(ignore_permissions=True)
+
+
+def make_exercise(name, primary_muscle=None):
+	if frappe.db.exists("Exercise", name):
+		return frappe.get_doc("Exercise", name)
+	return frappe.get_doc({
+		"doctype": "Exercise",
+		"exercise": name,
+		"primary_muscle": primary_muscle,
+	}).insert(ignore_permissions=True)
+
+
+def make_food(fdcid, title=None, facts=None):
+	if frappe.db.exists("Food", str(fdcid)):
+		return frappe.get_doc("Food", str(fdcid))
+	food = frappe.get_doc({
+		"doctype": "Food",
+		"fdcid": fdcid,
+		"title": title or f"Food {fdcid}",
+		"nutritional_facts": [
+			{"nutrient": nutrient, "value": value, "unit": unit}
+			for nutrient, value, unit in (facts or [])
+		],
+	})
+	# Skip the FDC lookup of before_insert
+	food.flags.fdc_data_applied = True
+	return food.insert(ignore_permissions=True)
+
+
+def make_plan(client, membership, exercises=(), foods=(), **fields):
+	"""Plan with the given exercises (3 x 10) and (food, amount) pairs on day 1, dates follow the membership"""
+	return frappe.get_doc({
+		"doctype": "Plan",
+		"client": client,
+		"membership": membership,
+		"weekly_workouts": 3,
+		"d1_e": [{"exercise": exercise, "sets": 3, "reps": 10, "rest": 60} for exercise in exercises],
+		"d1_f": [{"meal": "Breakfast", "food": food, "amount": amount} for food, amount in foods],
+		**fields,
+	}).insert(ignore_permissions=True)
@@ -0,0 +1,162 @@
+import frappe
+from frappe.utils import add_days, cint, get_datetime, getdate, now_datetime
+
+from personal_trainer_app.api import MembershipCache, enqueue_membership_warmup, warm_active_membership_caches
+from personal_trainer_app.client_stats import COUNTER_FIELDS, aggregate_exercise_counters, apply_counter_deltas
+
+# Status of a plan and the time of its next change, the SQL mirrors plan_transition()
+PLAN_STATUS_SQL = """CASE
+    WHEN `end` < %(today)s THEN 'Completed'
+    WHEN `start` <= %(today)s THEN 'Active'
+    ELSE 'Scheduled' END"""
+PLAN_NEXT_TRANSITION_SQL = """CASE
+    WHEN `end` < %(today)s THEN NULL
+    WHEN `start` <= %(today)s THEN TIMESTAMP(DATE_ADD(`end`, INTERVAL 1 DAY))
+    ELSE TIMESTAMP(`start`) END"""
+
+# Active flag of a membership and the time of its next change, mirrors window_transition()
+MEMBERSHIP_ACTIVE_SQL = "(`start` <= %(now)s AND `end` >= %(now)s)"
+MEMBERSHIP_NEXT_TRANSITION_SQL = """CASE
+    WHEN %(now)s < `start` THEN `start`
+    WHEN %(now)s <= `end` THEN `end`
+    ELSE NULL END"""
+
+# Enabled flag of a scheduled promo code and the time of its next change, mirrors window_transition()
+PROMO_CODE_ENABLED_SQL = "(TIMESTAMP(`start`) <= %(now)s AND TIMESTAMP(`end`) >= %(now)s)"
+PROMO_CODE_NEXT_TRANSITION_SQL = """CASE
+    WHEN %(now)s < TIMESTAMP(`start`) THEN TIMESTAMP(`start`)
+    WHEN %(now)s <= TIMESTAMP(`end`) THEN TIMESTAMP(`end`)
+    ELSE NULL END"""
+
+def plan_transition(start, end, today=None):
+    """(status, next_transition_at) of a plan running from `start` to `end` inclusive"""
+    today = getdate(today)
+    start, end = getdate(start), getdate(end)
+    if today > end:
+        return "Completed", None
+    if start <= today:
+        return "Active", get_datetime(add_days(end, 1))
+    return "Scheduled", get_datetime(start)
+
+def window_transition(start, end, now=None):
+    """(flag, next_transition_at) of a membership or promo code that is on from `start` to `end`"""
+    now = now or now_datetime()
+    start, end = get_datetime(start), get_datetime(end)
+    if now < start:
+        return 0, start
+    if now <= end:
+        return 1, end
+    return 0, None
+
+def get_plan_next_transition(plan):
+    """Next transition of a plan being saved, now when its status is behind its dates"""
+    if plan.status == "Completed" or not (plan.start and plan.end):
+        return None
+    status, next_transition_at = plan_transition(plan.start, plan.end)
+    return next_transition_at if status == plan.status else now_datetime()
+
+def get_window_next_transition(flag, start, end):
+    """Next transition of a membership or promo code being saved, now when its flag is behind its dates"""
+    if not (start and end):
+        return None
+    value, next_transition_at = window_transition(start, end)
+    return next_transition_at if value == cint(flag) else now_datetime()
+
+def get_due(doctype, fields, now):
+    return frappe.get_all(
+        doctype,
+        filters={"next_transition_at": ["<=", now]},
+        fields=["name", *fields]
+    )
+
+def apply_plan_transitions(now):
+    """Move due plans to their current status, returns the plans whose status changed"""
+    today = getdate(now)
+    due = get_due("Plan", ["client", "membership", "status", "start", "end"], now)
+    if not due:
+        return []
+
+    frappe.db.sql(f"""
+        UPDATE `tabPlan`
+        SET modified = IF({PLAN_STATUS_SQL} != status, %(now)s, modified),
+            status = {PLAN_STATUS_SQL},
+            next_transition_at = {PLAN_NEXT_TRANSITION_SQL}
+        WHERE name IN %(names)s
+    """, {"today": today, "now": now, "names": tuple(plan.name for plan in due)})
+
+    changed = [plan for plan in due if plan_transition(plan.start, plan.end, today)[0] != plan.status]
+    completed = [plan.name for plan in changed if plan_transition(plan.start, plan.end, today)[0] == "Completed"]
+
+    # Plans completed here never pass through on_plan_update, add their contribution to client statistics
+    deltas = {}
+    clients = {plan.name: plan.client for plan in changed}
+    for plan, counters in aggregate_exercise_counters(group_by="plan", plans=completed).items():
+        delta = deltas.setdefault(clients[plan], dict.fromkeys(COUNTER_FIELDS, 0))
+        for field, value in counters.items():
+            delta[field] += value
+    apply_counter_deltas(deltas)
+
+    memberships = list({plan.membership for plan in changed if plan.membership})
+    MembershipCache().invalidate_membership_caches(memberships)
+    for membership in memberships:
+        enqueue_membership_warmup(membership)
+    return changed
+
+def apply_membership_transitions(now):
+    """Activate or expire due memberships, returns the memberships whose active flag changed"""
+    due = get_due("Membership", ["active", "start", "end"], now)
+    if not due:
+        return []
+
+    frappe.db.sql(f"""
+        UPDATE `tabMembership`
+        SET active = {MEMBERSHIP_ACTIVE_SQL},
+            next_transition_at = {MEMBERSHIP_NEXT_TRANSITION_SQL}
+        WHERE name IN %(names)s
+    """, {"now": now, "names": tuple(membership.name for membership in due)})
+
+    changed = [
+        membership.name for membership in due
+        if window_transition(membership.start, membership.end, now)[0] != membership.active
+    ]
+    MembershipCache().invalidate_membership_caches(changed)
+    for membership in due:
+        if membership.name in changed and not membership.active:
+            # Activated just now, build its payload before the client asks for it
+            enqueue_membership_warmup(membership.name)
+    return changed
+
+def apply_promo_code_transitions(now):
+    """Enable or disable due promo codes, returns the codes whose enabled flag changed"""
+    due = get_due("Promo Code", ["enabled", "start", "end"], now)
+    if not due:
+        return []
+
+    frappe.db.sql(f"""
+        UPDATE `tabPromo Code`
+        SET enabled = {PROMO_CODE_ENABLED_SQL},
+            next_transition_at = {PROMO_CODE_NEXT_TRANSITION_SQL}
+        WHERE name IN %(names)s
+    """, {"now": now, "names": tuple(code.name for code in due)})
+
+    return [
+        code.name for code in due
+        if window_transition(code.start, code.end, now)[0] != code.enabled
+    ]
+
+def run_due_transitions():
+    """
+    Hourly: apply the status changes of plans, memberships and promo codes that are due,
+    then warm the active memberships whose payload is outdated or about to expire.
+    Records are found through the indexed next_transition_at column and updated set-based.
+    """
+    now = now_datetime()
+    plans = apply_plan_transitions(now)
+    memberships = apply_membership_transitions(now)
+    promo_codes = apply_promo_code_transitions(now)
+    # Payloads cached for 24 hours would otherwise go cold for clients who skip a day
+    warm_active_membership_caches()
+    frappe.db.commit()
+    frappe.log(
+        f"Transitions applied: {len(plans)} plans, {len(memberships)} memberships, {len(promo_codes)} promo codes"
+    )